@@ -0,0 +1,220 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# End-to-end benchmark that never leaves the machine. Supplier SOAP and
+# OpenAI embeddings are served by local HTTP fakes, Qdrant runs in memory
+# (QdrantClient(":memory:")) and Supabase is an in-memory table. It runs the
+# redesign ingestion pipeline for one supplier, then drives the frontend's
+# /search and /inventory routes, and reports:
+#
+#   ingest_products_per_second, search_p50_ms, search_p99_ms,
+#   inventory_p50_ms, inventory_p99_ms
+#
+#   python benchmarks/e2e_bench.py --products 500 --save-baseline
+#   python benchmarks/e2e_bench.py --products 500            # compares to the baseline
+#   python benchmarks/e2e_bench.py --recordings response_archive   # replay archived responses
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Which direction is better for each reported metric
+HIGHER_IS_BETTER = {"ingest_products_per_second"}
+
+QUERY_WORDS = ["polo", "t-shirt", "hoodie", "jacket", "cap", "vest", "fleece", "performance", "classic",
+               "heavyweight", "moisture-wicking", "nike", "ogio", "workwear", "tri-blend", "navy", "black"]
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    index = min(len(samples) - 1, max(0, round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def _configure_env(soap_url, embedding_url, supplier, scratch_dir):
+    # Must run before the redesign config and the frontend are imported
+    upper = supplier.upper()
+    os.environ[f"SOAP_URL_{upper}"] = f"{soap_url}/product"
+    os.environ[f"SOAP_ID_{upper}"] = "bench"
+    os.environ[f"SOAP_PASSWORD_{upper}"] = "bench"
+    os.environ["SOAP_INVENTORY_URL_SANMAR"] = f"{soap_url}/inventory"
+    os.environ["SOAP_ID"] = "bench"
+    os.environ["SOAP_PASSWORD"] = "bench"
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["OPENAI_BASE_URL"] = f"{embedding_url}/v1"
+    os.environ["CATALOG_REFRESH_SECONDS"] = "0"
+    # Synthetic failures must never reach the real dead-letter store, where a
+    # later retry-failed would send them to the supplier
+    os.environ["DEAD_LETTER_DB"] = os.path.join(scratch_dir, "dead_letter.sqlite3")
+    os.environ["RUN_SUMMARY_DIR"] = os.path.join(scratch_dir, "run_summaries")
+    # Measure the code, not the production rate limits; override to test those
+    os.environ.setdefault(f"SOAP_RATE_{upper}", "10000")
+    os.environ.setdefault(f"SOAP_CONCURRENCY_{upper}", "64")
+    os.environ.setdefault("OPENAI_RATE", "10000")
+    os.environ.setdefault("OPENAI_CONCURRENCY", "64")
+    for path in (REPO_ROOT, os.path.join(REPO_ROOT, "redesign")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+@contextlib.contextmanager
+def _quiet(verbose):
+    if verbose:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def run(args):
+    from fakes import FakeEmbeddingServer, FakeSOAPServer, FakeSupabase
+
+    recordings = None
+    if args.recordings:
+        sys.path.insert(0, os.path.join(REPO_ROOT, "redesign"))
+        from archive import ResponseArchive
+        recordings = ResponseArchive(args.recordings, args.supplier)
+
+    soap = FakeSOAPServer(products=args.products, recordings=recordings, latency=args.soap_latency)
+    embeddings = FakeEmbeddingServer(latency=args.embedding_latency)
+    with soap, embeddings, tempfile.TemporaryDirectory(prefix="e2e-bench-") as scratch_dir:
+        _configure_env(soap.url, embeddings.url, args.supplier, scratch_dir)
+
+        from qdrant_client import QdrantClient
+        import main as ingest
+        import supabase_store
+        import vector_store
+
+        supabase = FakeSupabase(latency=args.supabase_latency)
+        qdrant = QdrantClient(":memory:")
+        supabase_store.get_supabase = lambda: supabase
+        vector_store.get_qdrant = lambda: qdrant
+        vector_store.init_collection()
+
+        # Ingestion
+        started = time.perf_counter()
+        with _quiet(args.verbose):
+            ingest.process_products(args.supplier, fetch_workers=args.fetch_workers,
+                                    parse_workers=args.parse_workers, store_workers=args.store_workers,
+                                    report_interval=3600)
+        ingest_seconds = time.perf_counter() - started
+        table = supabase.table("search_engine").select("product_id", count="exact").execute()
+        ingested = table.count
+
+        # Search and inventory through the Flask app
+        import search_engine_frontend as frontend
+        frontend.get_qdrant = lambda: qdrant
+        frontend.get_supabase = lambda: supabase
+        client = frontend.app.test_client()
+        with _quiet(args.verbose):
+            frontend.warm_up()
+
+        rnd = random.Random(0)
+        search_times = []
+        search_hits = 0
+        for _ in range(args.searches):
+            query = " ".join(rnd.sample(QUERY_WORDS, rnd.randint(1, 3)))
+            t = time.perf_counter()
+            resp = client.get("/search", query_string={"q": query})
+            search_times.append(time.perf_counter() - t)
+            assert resp.status_code == 200, resp.status_code
+            search_hits += len(resp.get_json())
+
+        rows = supabase.table("search_engine").select("*").execute().data
+        inventory_times = []
+        with _quiet(args.verbose):
+            for _ in range(args.inventory_checks if rows else 0):
+                product = rnd.choice(rows)
+                t = time.perf_counter()
+                resp = client.post("/inventory", json={
+                    "product_id": product["product_id"],
+                    "color": rnd.choice(product.get("colors") or ["Black"]),
+                    "size": rnd.choice(product.get("sizes") or ["L"]),
+                })
+                inventory_times.append(time.perf_counter() - t)
+                assert resp.status_code == 200, resp.status_code
+
+        report = {
+            "ingest_products_per_second": ingested / ingest_seconds if ingest_seconds else 0.0,
+            "search_p50_ms": percentile(search_times, 50) * 1000,
+            "search_p99_ms": percentile(search_times, 99) * 1000,
+        }
+        if inventory_times:
+            report["inventory_p50_ms"] = percentile(inventory_times, 50) * 1000
+            report["inventory_p99_ms"] = percentile(inventory_times, 99) * 1000
+        context = {
+            "products": ingested,
+            "ingest_seconds": ingest_seconds,
+            "soap_requests": soap.requests,
+            "embedding_requests": embeddings.requests,
+            "searches": len(search_times),
+            "avg_results_per_search": search_hits / len(search_times) if search_times else 0.0,
+            "inventory_checks": len(inventory_times),
+        }
+        return report, context
+
+
+def compare(report, baseline, threshold):
+    regressions = []
+    print(f"{'metric':<30} {'baseline':>12} {'current':>12} {'change':>9}")
+    for metric, value in report.items():
+        base = baseline.get(metric)
+        if base is None:
+            print(f"{metric:<30} {'-':>12} {value:>12.2f}")
+            continue
+        change = (value - base) / base if base else 0.0
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(metric)
+        print(f"{metric:<30} {base:>12.2f} {value:>12.2f} {change:>+9.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end ingestion and search benchmark")
+    parser.add_argument("--supplier", default="sanmar",
+                        help="supplier client to ingest with; synthetic responses use SanMar's format")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--recordings", metavar="DIR",
+                        help="response archive to replay instead of synthetic products")
+    parser.add_argument("--soap-latency", type=float, default=0.05, help="seconds per SOAP request")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="seconds per embeddings request")
+    parser.add_argument("--supabase-latency", type=float, default=0.0, help="seconds per Supabase query")
+    parser.add_argument("--fetch-workers", type=int, default=8)
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--store-workers", type=int, default=8)
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--inventory-checks", type=int, default=100)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative change counted as a regression (default: %(default)s)")
+    parser.add_argument("--verbose", action="store_true", help="show ingestion and frontend output")
+    args = parser.parse_args(argv)
+
+    report, context = run(args)
+    print(json.dumps(context, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
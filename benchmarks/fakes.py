@@ -0,0 +1,369 @@
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+
+# Local stand-ins for the external services, for benchmarks only:
+#   FakeSupabase         in-memory search_engine table behind the query-builder API we use
+#   FakeSOAPServer       PromoStandards ProductData/Inventory over HTTP, replaying recorded
+#                        GetProduct responses (or synthetic ones) with configurable latency
+#   FakeEmbeddingServer  OpenAI-compatible /v1/embeddings with deterministic vectors
+# Qdrant is covered by qdrant_client's own QdrantClient(":memory:").
+
+
+class _Result(SimpleNamespace):
+    pass
+
+
+class _Query:
+    def __init__(self, table):
+        self._table = table
+        self._filters = []
+        self._order = None
+        self._limit = None
+        self._count = None
+        self._columns = None
+        self._upsert = None
+        self._negate = False
+
+    def select(self, columns="*", count=None):
+        if columns.strip() != "*":
+            self._columns = [c.strip() for c in columns.split(",")]
+        self._count = count
+        return self
+
+    def upsert(self, rows):
+        self._upsert = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda r: r.get(column) in values)
+        return self
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def is_(self, column, value):
+        # Only the "null" form is used
+        negate, self._negate = self._negate, False
+        self._filters.append(lambda r: (r.get(column) is None) != negate)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r[column] > value)
+        return self
+
+    def gte(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r[column] >= value)
+        return self
+
+    def lte(self, column, value):
+        self._filters.append(lambda r: r.get(column) is not None and r[column] <= value)
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def execute(self):
+        if self._upsert is not None:
+            with self._table.lock:
+                for row in self._upsert:
+                    # Like the updated_at default and trigger in supabase/migrations
+                    stamped = dict(row, updated_at=datetime.now(timezone.utc).isoformat())
+                    self._table.rows[row["product_id"]] = stamped
+            return _Result(data=self._upsert, count=None)
+
+        with self._table.lock:
+            rows = [r for r in self._table.rows.values() if all(f(r) for f in self._filters)]
+        count = len(rows) if self._count else None
+        if self._order:
+            column, desc = self._order
+            rows.sort(key=lambda r: r.get(column) or "", reverse=desc)
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        if self._columns:
+            rows = [{c: r.get(c) for c in self._columns} for r in rows]
+        else:
+            rows = [dict(r) for r in rows]
+        return _Result(data=rows, count=count)
+
+
+class _Table:
+    def __init__(self):
+        self.rows = {}
+        self.lock = threading.Lock()
+
+
+class FakeSupabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._tables = {}
+
+    def table(self, name):
+        if self.latency:
+            time.sleep(self.latency)
+        return _Query(self._tables.setdefault(name, _Table()))
+
+
+# --- PromoStandards SOAP -----------------------------------------------------
+
+PDS_NS = "http://www.promostandards.org/WSDL/ProductDataService/2.0.0/"
+PDS_SHARED_NS = "http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/"
+INV_NS = "http://www.promostandards.org/WSDL/Inventory/2.0.0/"
+INV_SHARED_NS = "http://www.promostandards.org/WSDL/Inventory/2.0.0/SharedObjects/"
+
+BRANDS = ["Port Authority", "Sport-Tek", "District", "Nike", "OGIO", "Eddie Bauer", "Red Kap", "New Era"]
+GARMENTS = ["Polo", "T-Shirt", "Hoodie", "Jacket", "Cap", "Vest", "Quarter-Zip", "Fleece"]
+ADJECTIVES = ["Core", "Performance", "Classic", "Tri-Blend", "Heavyweight", "Essential", "Moisture-Wicking"]
+COLORS = ["Black", "White", "Navy", "Red", "Royal", "Forest Green", "Charcoal", "Heather Grey", "Maroon", "Gold"]
+SIZES = ["XS", "S", "M", "L", "XL", "2XL", "3XL", "4XL"]
+CATEGORIES = ["Polos/Knits", "T-Shirts", "Sweatshirts/Fleece", "Outerwear", "Caps", "Workwear", "Activewear"]
+
+
+def synthetic_product_xml(product_id, seed=0):
+    # A GetProductResponse shaped like SanMar's 2.0.0 responses
+    rnd = random.Random(f"{seed}:{product_id}")
+    brand = rnd.choice(BRANDS)
+    garment = rnd.choice(GARMENTS)
+    name = f"{brand} {rnd.choice(ADJECTIVES)} {garment}"
+    colors = rnd.sample(COLORS, rnd.randint(2, 8))
+    sizes = SIZES[:rnd.randint(3, len(SIZES))]
+    description = " ".join(
+        f"{rnd.choice(ADJECTIVES)} {garment.lower()} with {rnd.choice(['taped neck', 'side vents', 'tag-free label', 'open cuffs', 'double-needle hem'])}."
+        for _ in range(rnd.randint(3, 8))
+    )
+    parts = []
+    for i, color in enumerate(colors):
+        for size in sizes:
+            parts.append(f"""
+        <ns2:ProductPart>
+          <partId>{escape(product_id)}-{i}-{size}</partId>
+          <ns2:primaryColor><Color><standardColorName>{escape(color)}</standardColorName></Color></ns2:primaryColor>
+          <ApparelSize><labelSize>{size}</labelSize></ApparelSize>
+          <gtin>{rnd.randint(10**11, 10**12 - 1)}</gtin>
+          <isRushService>false</isRushService>
+          <isCloseout>{str(rnd.random() < 0.1).lower()}</isCloseout>
+          <isCaution>false</isCaution>
+          <isOnDemand>false</isOnDemand>
+          <isHazmat>false</isHazmat>
+        </ns2:ProductPart>""")
+    keywords = "".join(f"<ProductKeyword><keyword>{escape(k)}</keyword></ProductKeyword>"
+                       for k in {garment.lower(), brand.lower(), rnd.choice(ADJECTIVES).lower()})
+    category = rnd.choice(CATEGORIES)
+    return f"""<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/">
+  <S:Body>
+    <ns2:GetProductResponse xmlns:ns2="{PDS_NS}" xmlns="{PDS_SHARED_NS}">
+      <ns2:Product>
+        <productId>{escape(product_id)}</productId>
+        <productName>{escape(name)}</productName>
+        <description>{escape(description)}</description>
+        <ns2:ProductKeywordArray>{keywords}</ns2:ProductKeywordArray>
+        <productBrand>{escape(brand)}</productBrand>
+        <ns2:ProductCategoryArray>
+          <ProductCategory><category>{escape(category)}</category><subCategory>{escape(garment)}, {escape(brand)}</subCategory></ProductCategory>
+        </ns2:ProductCategoryArray>
+        <ns2:ProductPartArray>{''.join(parts)}
+        </ns2:ProductPartArray>
+        <primaryImageUrl>https://example.com/images/{escape(product_id)}.jpg</primaryImageUrl>
+      </ns2:Product>
+    </ns2:GetProductResponse>
+  </S:Body>
+</S:Envelope>""".encode()
+
+
+def sellable_xml(product_ids):
+    items = "".join(f"<ns2:ProductSellable><productId>{escape(pid)}</productId></ns2:ProductSellable>"
+                    for pid in product_ids)
+    return f"""<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/">
+  <S:Body>
+    <ns2:GetProductSellableResponse xmlns:ns2="{PDS_NS}" xmlns="{PDS_SHARED_NS}">
+      <ns2:ProductSellableArray>{items}</ns2:ProductSellableArray>
+    </ns2:GetProductSellableResponse>
+  </S:Body>
+</S:Envelope>""".encode()
+
+
+def inventory_xml(product_id, seed=0):
+    rnd = random.Random(f"{seed}:inv:{product_id}")
+    locations = "".join(f"""
+        <shar:InventoryLocation>
+          <shar:inventoryLocationName>{name}</shar:inventoryLocationName>
+          <shar:inventoryLocationQuantity><shar:Quantity><shar:uom>EA</shar:uom><shar:value>{rnd.randint(0, 5000)}</shar:value></shar:Quantity></shar:inventoryLocationQuantity>
+        </shar:InventoryLocation>""" for name in ("Seattle, WA", "Cincinnati, OH", "Dallas, TX", "Reno, NV", "Jacksonville, FL"))
+    return f"""<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/">
+  <S:Body>
+    <ns2:GetInventoryLevelsResponse xmlns:ns2="{INV_NS}" xmlns:shar="{INV_SHARED_NS}">
+      <ns2:Inventory><shar:productId>{escape(product_id)}</shar:productId>
+        <shar:PartInventoryArray><shar:PartInventory><shar:InventoryLocationArray>{locations}
+        </shar:InventoryLocationArray></shar:PartInventory></shar:PartInventoryArray>
+      </ns2:Inventory>
+    </ns2:GetInventoryLevelsResponse>
+  </S:Body>
+</S:Envelope>""".encode()
+
+
+_PRODUCT_ID_RE = re.compile(rb"<(?:\w+:)?productId>([^<]*)</(?:\w+:)?productId>")
+
+
+class _Server:
+    # Runs a ThreadingHTTPServer on a free local port in a daemon thread
+    handler = None
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        owner = self
+
+        class Handler(self.handler):
+            server_owner = owner
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class _SOAPHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        owner = self.server_owner
+        owner.count()
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if owner.latency:
+            time.sleep(owner.latency)
+
+        if b"GetProductSellableRequest" in body:
+            payload = sellable_xml(owner.product_ids)
+        elif b"GetInventoryLevelsRequest" in body:
+            m = _PRODUCT_ID_RE.search(body)
+            payload = inventory_xml(m.group(1).decode() if m else "", owner.seed)
+        elif b"GetProductRequest" in body:
+            m = _PRODUCT_ID_RE.search(body)
+            payload = owner.product_response(m.group(1).decode() if m else "")
+        else:
+            self.send_error(400, "Unsupported SOAP request")
+            return
+        if payload is None:
+            self.send_error(404, "Unknown product")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeSOAPServer(_Server):
+    # Serves GetProductSellable, GetProduct and GetInventoryLevels. With a
+    # `recordings` object exposing product_ids() and read(pid) -- e.g. the
+    # redesign ResponseArchive -- recorded GetProduct responses are replayed;
+    # otherwise `products` synthetic SanMar-style products are generated.
+    handler = _SOAPHandler
+
+    def __init__(self, products=500, recordings=None, latency=0.0, seed=0):
+        super().__init__(latency)
+        self.seed = seed
+        self.recordings = recordings
+        if recordings is not None:
+            self.product_ids = list(recordings.product_ids())[:products]
+        else:
+            self.product_ids = [f"BENCH{i:05d}" for i in range(products)]
+        self._cache = {}
+
+    def product_response(self, product_id):
+        if self.recordings is not None:
+            return self.recordings.read(product_id)
+        if product_id not in self._cache:
+            self._cache[product_id] = synthetic_product_xml(product_id, self.seed)
+        return self._cache[product_id]
+
+
+# --- OpenAI embeddings ---------------------------------------------------------
+
+def fake_embedding(text, dim=1536):
+    # Deterministic unit vector seeded from the text. Texts sharing words
+    # land near each other, which keeps search results meaningful.
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=16).digest()
+        seed, = struct.unpack("<Q", digest[:8])
+        rnd = random.Random(seed)
+        for _ in range(8):
+            vector[rnd.randrange(dim)] += rnd.uniform(-1, 1)
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class _EmbeddingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        owner = self.server_owner
+        owner.count()
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        if owner.latency:
+            time.sleep(owner.latency)
+        inputs = request["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        body = json.dumps({
+            "object": "list",
+            "model": request.get("model", "text-embedding-3-small"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text, owner.dim)}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeEmbeddingServer(_Server):
+    # Point the OpenAI SDK at it with OPENAI_BASE_URL=<url>/v1
+    handler = _EmbeddingHandler
+
+    def __init__(self, dim=1536, latency=0.0):
+        super().__init__(latency)
+        self.dim = dim
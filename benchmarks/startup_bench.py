@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Cold-start benchmark for the search frontend. Each run starts a fresh
+# interpreter, imports search_engine_frontend and optionally calls warm_up(),
+# so the numbers include everything a new worker pays before serving.
+#
+#   python benchmarks/startup_bench.py --runs 10
+#   python benchmarks/startup_bench.py --warm-up     # needs real or fake services
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import search_engine_frontend as frontend
+imported = time.perf_counter()
+if {warm_up}:
+    frontend.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({{"import": imported - started, "warm_up": warmed - imported}}))
+"""
+
+
+def measure(warm_up=False):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(warm_up=warm_up)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    return (f"{name:<8} median {statistics.median(samples) * 1000:8.1f} ms  "
+            f"min {samples[0] * 1000:8.1f} ms  max {samples[-1] * 1000:8.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure search frontend cold-start time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-up", action="store_true", help="also time warm_up() after the import")
+    parser.add_argument("--json", action="store_true", help="print raw samples as JSON")
+    args = parser.parse_args(argv)
+
+    results = [measure(args.warm_up) for _ in range(args.runs)]
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(summarize("import", [r["import"] for r in results]))
+    if args.warm_up:
+        print(summarize("warm-up", [r["warm_up"] for r in results]))
+        print(summarize("total", [r["import"] + r["warm_up"] for r in results]))
+
+
+if __name__ == "__main__":
+    main()
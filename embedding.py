@@ -1,11 +1,22 @@
 from openai import OpenAI
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
+from qdrant_client.models import PointStruct
 from supabase import create_client
-import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import time
+import uuid
 import os
 
+from redesign.config import (OPENAI_RATE, OPENAI_CONCURRENCY, REQUEST_MAX_RETRIES, QDRANT_PAYLOAD_FIELDS,
+                             QDRANT_ON_DISK_PAYLOAD)
+from redesign.lazy import per_process
+from redesign.scheduler import scheduler
+from redesign.qdrant_collections import (ensure_collection, create_build_collection, finish_build, switch_alias,
+                                         collect_garbage, bump_content_version)
+from redesign.qdrant_payload import parse_payload_fields, project_payload, migrate_payloads, set_on_disk_payload
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -15,6 +26,17 @@ SUPABASE_TABLE = "search_engine"
 openai_api_key = os.getenv("OPENAI_API_KEY")
 qdrant_url = os.getenv("QDRANT_URL")
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
+PRODUCT_COLUMNS = "product_id, name, brand, description, keywords, categories, colors, sizes"
+# Column used by --since for partial reindexes
+SINCE_COLUMN = os.getenv("REINDEX_SINCE_COLUMN", "created_at")
+# Set by the database on every write (supabase/migrations); used to catch up
+# after a rebuild
+UPDATED_AT_COLUMN = "updated_at"
+PAGE_SIZE = 1000
+# OpenAI accepts at most 2048 inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 256
+# Fields kept in Qdrant payloads; the frontend hydrates full rows from Supabase
+PAYLOAD_FIELDS = parse_payload_fields(QDRANT_PAYLOAD_FIELDS)
 
 def get_point_id(product_id_str):
     # Use UUID5 (namespace + name) to deterministically generate UUID from string ID
@@ -22,69 +44,219 @@ def get_point_id(product_id_str):
     return str(uuid.uuid5(namespace, product_id_str))
 
 
-# Connect
-openai_client = OpenAI(api_key=openai_api_key)
-qdrant = QdrantClient(
-    url=qdrant_url,
-    api_key=qdrant_api_key,
-)
-supabase = create_client(supabase_url, supabase_key)
+# Connect lazily, once per process, so importing this module has no side effects
+@per_process
+def get_openai_client():
+    scheduler.configure("openai", OPENAI_RATE, concurrency=OPENAI_CONCURRENCY, max_retries=REQUEST_MAX_RETRIES)
+    # Retries and pacing are handled by the shared scheduler, not the SDK
+    return OpenAI(api_key=openai_api_key, max_retries=0)
 
-# Create collection
-VECTOR_DIM = 1536
-COLLECTION_NAME = "products"
 
-# Check if collection exists
-if not qdrant.collection_exists(COLLECTION_NAME):
-    qdrant.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE)
+@per_process
+def get_qdrant():
+    return QdrantClient(
+        url=qdrant_url,
+        api_key=qdrant_api_key,
     )
-else:
-    print(f"Collection '{COLLECTION_NAME}' already exists. Skipping creation.")
 
 
-# Generate vector
-def get_embedding(text):
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+@per_process
+def get_supabase():
+    return create_client(supabase_url, supabase_key)
 
-# Load product data from Supabase
-response = supabase.table("search_engine").select(
-    "product_id, name, brand, description, keywords, categories, colors, sizes"
-).execute()
 
-products = response.data
+VECTOR_DIM = 1536
+# Alias (or, before the first rebuild, plain collection) that search reads from
+COLLECTION_NAME = "products"
+
+# Generate vectors, one request per batch of texts
+def get_embeddings(texts):
+    response = scheduler.call(
+        "openai",
+        get_openai_client().embeddings.create,
+        model="text-embedding-3-small",
+        input=texts
+    )
+    return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
 
 
-# Upload to Qdrant
-points = []
-for product in products:
+def product_text(product):
     text_parts = [
-        product.get("name", ""),
-        product.get("brand", ""),
-        product.get("description", ""),
+        product.get("name") or "",
+        product.get("brand") or "",
+        product.get("description") or "",
         ", ".join(product.get("keywords", []) or []),
         ", ".join(product.get("categories", []) or [])
     ]
-    combined_text = " ".join(text_parts)
-    # Generate embedding with OpenAI
-    vector = get_embedding(combined_text)
-
-    point = PointStruct(
-        id=get_point_id(product["product_id"]),
-        vector=vector,
-        payload=product
-    )
+    return " ".join(text_parts)
 
-    # Upsert this single point to Qdrant
-    qdrant.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[point]
+
+# Load product data from Supabase one keyset page at a time, so memory stays
+# flat no matter how large the table is
+def iter_product_pages(page_size=PAGE_SIZE, since=None, from_id=None, to_id=None, since_column=SINCE_COLUMN):
+    last_id = None
+    while True:
+        query = (
+            get_supabase()
+            .table(SUPABASE_TABLE)
+            .select(PRODUCT_COLUMNS)
+            .order("product_id")
+            .limit(page_size)
+        )
+        if since:
+            query = query.gte(since_column, since)
+        if last_id is not None:
+            query = query.gt("product_id", last_id)
+        elif from_id:
+            query = query.gte("product_id", from_id)
+        if to_id:
+            query = query.lte("product_id", to_id)
+        page = query.execute().data
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1]["product_id"]
+
+
+def embed_and_upsert(products, collection_name=COLLECTION_NAME):
+    vectors = get_embeddings([product_text(p) for p in products])
+    points = [
+        PointStruct(id=get_point_id(p["product_id"]), vector=vector, payload=project_payload(p, PAYLOAD_FIELDS))
+        for p, vector in zip(products, vectors)
+    ]
+    get_qdrant().upsert(collection_name=collection_name, points=points)
+    return len(points)
+
+
+# Upload to Qdrant
+def reindex(page_size=PAGE_SIZE, batch_size=EMBEDDING_BATCH_SIZE, workers=4, since=None,
+            from_id=None, to_id=None, collection_name=COLLECTION_NAME, since_column=SINCE_COLUMN):
+    started = time.monotonic()
+    uploaded = 0
+    in_flight = deque()
+    # Reading the next page overlaps with embedding/upserting earlier
+    # batches; at most `workers * 2` batches are held at once
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for page in iter_product_pages(page_size, since=since, from_id=from_id, to_id=to_id,
+                                       since_column=since_column):
+            for start in range(0, len(page), batch_size):
+                while len(in_flight) >= workers * 2:
+                    uploaded += in_flight.popleft().result()
+                in_flight.append(pool.submit(embed_and_upsert, page[start:start + batch_size], collection_name))
+            elapsed = time.monotonic() - started
+            print(f"Read up to {page[-1]['product_id']} | uploaded {uploaded} products to Qdrant "
+                  f"({uploaded / elapsed if elapsed else 0:.1f}/s)")
+        while in_flight:
+            uploaded += in_flight.popleft().result()
+    if uploaded:
+        # Vectors changed without Supabase changing; tell the frontend's ETags
+        bump_content_version(get_qdrant(), collection_name)
+    print(f"Uploaded {uploaded} products to Qdrant in {time.monotonic() - started:.0f}s.")
+    return uploaded
+
+
+def supabase_row_count():
+    return get_supabase().table(SUPABASE_TABLE).select("product_id", count="exact").limit(1).execute().count
+
+
+def latest_updated_at():
+    # Newest write according to the database's own clock, so a watermark
+    # taken here is comparable with every writer's updated_at regardless of
+    # which host wrote it. None for an empty table.
+    res = (
+        get_supabase()
+        .table(SUPABASE_TABLE)
+        .select(UPDATED_AT_COLUMN)
+        .not_.is_(UPDATED_AT_COLUMN, "null")
+        .order(UPDATED_AT_COLUMN, desc=True)
+        .limit(1)
+        .execute()
     )
-    print(f"Uploaded {len(points)} products to Qdrant.")
-    # exit(1)
-    time.sleep(0.5)
+    return res.data[0][UPDATED_AT_COLUMN] if res.data else None
+
+
+def catch_up(since, collection_name, **options):
+    # Re-embed rows written at or after `since`; None means every row, which
+    # is right when the table was empty when the watermark was taken
+    print(f"Catching up on rows with {UPDATED_AT_COLUMN} >= {since} into {collection_name}")
+    return reindex(since=since, since_column=UPDATED_AT_COLUMN, collection_name=collection_name, **options)
+
+
+# Full rebuild into a fresh versioned collection, then atomically point the
+# alias at it, so search never sees a half-built or out-of-date index
+def rebuild(keep=2, drop_legacy_collection=False, index_timeout=3600, **options):
+    qdrant = get_qdrant()
+    # Ingestion keeps writing through the alias, i.e. into the old
+    # collection, while the build runs. Watermarks come from the database so
+    # those writes can be found again without trusting this host's clock.
+    build_started = latest_updated_at()
+    rows_before = supabase_row_count()
+    build = create_build_collection(qdrant, COLLECTION_NAME, VECTOR_DIM,
+                                    on_disk_payload=QDRANT_ON_DISK_PAYLOAD or None)
+    reindex(collection_name=build, **options)
+    # Bring the build up to date before anyone searches it
+    catch_up_started = latest_updated_at()
+    catch_up(build_started, build, **options)
+    # Validate against Supabase, not against what this run uploaded. Rows
+    # added or deleted during the build may or may not have been read.
+    rows_after = supabase_row_count()
+    finish_build(qdrant, build, min(rows_before, rows_after), max(rows_before, rows_after), timeout=index_timeout)
+    switch_alias(qdrant, COLLECTION_NAME, build, drop_legacy_collection=drop_legacy_collection)
+    # Writes between the catch-up and the switch still went to the old
+    # collection; this pass is short because it only covers that gap
+    catch_up(catch_up_started, COLLECTION_NAME, **options)
+    collect_garbage(qdrant, COLLECTION_NAME, keep=keep)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed products from Supabase into Qdrant")
+    parser.add_argument("--since", help=f"only products whose {SINCE_COLUMN} is at or after this ISO timestamp")
+    parser.add_argument("--from-id", help="first product_id to include")
+    parser.add_argument("--to-id", help="last product_id to include")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help="rows per Supabase page (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE,
+                        help="products per embedding request and Qdrant upsert (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="embedding/upsert batches in flight (default: %(default)s)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help=f"build a new {COLLECTION_NAME}_v<n> collection and switch the "
+                             f"'{COLLECTION_NAME}' alias to it when done. Ingestion running meanwhile writes "
+                             f"to the old collection; rows whose {UPDATED_AT_COLUMN} changed during the "
+                             f"rebuild are re-embedded into the new one before the switch, and once more "
+                             f"after it for writes made in between. Needs supabase/migrations applied")
+    parser.add_argument("--keep", type=int, default=2,
+                        help="versioned collections to keep after a rebuild (default: %(default)s)")
+    parser.add_argument("--drop-legacy-collection", action="store_true",
+                        help=f"allow the first rebuild to replace a plain '{COLLECTION_NAME}' collection")
+    parser.add_argument("--index-timeout", type=float, default=3600,
+                        help="seconds to wait for HNSW indexing after a rebuild (default: %(default)s)")
+    parser.add_argument("--migrate-payload", action="store_true",
+                        help=f"rewrite existing point payloads to keep only {', '.join(PAYLOAD_FIELDS)}; "
+                             f"no embeddings are generated")
+    parser.add_argument("--on-disk-payload", action="store_true",
+                        help="with --migrate-payload, also move the collection's payloads to disk")
+    args = parser.parse_args(argv)
+
+    if args.migrate_payload:
+        qdrant = get_qdrant()
+        if args.on_disk_payload:
+            set_on_disk_payload(qdrant, COLLECTION_NAME)
+        scanned, rewritten = migrate_payloads(qdrant, COLLECTION_NAME, PAYLOAD_FIELDS, batch_size=args.page_size)
+        print(f"Payload migration done: {rewritten} of {scanned} points rewritten.")
+        return
+
+    options = dict(page_size=args.page_size, batch_size=min(args.batch_size, 2048), workers=args.workers)
+    if args.rebuild:
+        if args.since or args.from_id or args.to_id:
+            parser.error("--rebuild always reindexes the full table; drop --since/--from-id/--to-id")
+        rebuild(keep=args.keep, drop_legacy_collection=args.drop_legacy_collection,
+                index_timeout=args.index_timeout, **options)
+    else:
+        ensure_collection(get_qdrant(), COLLECTION_NAME, VECTOR_DIM, on_disk_payload=QDRANT_ON_DISK_PAYLOAD or None)
+        reindex(since=args.since, from_id=args.from_id, to_id=args.to_id, **options)
+
+
+if __name__ == "__main__":
+    main()
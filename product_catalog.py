@@ -0,0 +1,244 @@
+import json
+import sys
+import threading
+import time
+
+from redesign.metrics import cache_result, timed
+
+# Columns written by the ingestion scripts. Anything else returned by
+# select("*") is kept per record in `extra`.
+CATALOG_FIELDS = ("product_id", "name", "brand", "image_url", "description",
+                  "keywords", "categories", "colors", "sizes", "gtin", "flags")
+
+# Set by the database on every insert and update (supabase/migrations); the
+# catalog's change signal
+UPDATED_AT_COLUMN = "updated_at"
+# Postgres undefined_column, returned when the migration hasn't been applied
+UNDEFINED_COLUMN = "42703"
+
+# Upper bound on remembered unknown IDs between reloads
+MAX_UNKNOWN_IDS = 100_000
+
+_COLORS_ENCODED = 1
+_SIZES_ENCODED = 2
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_values(values):
+    # colors/sizes come back either as lists or as JSON-encoded strings;
+    # remember which so hydration returns exactly what Supabase would
+    if isinstance(values, str):
+        try:
+            decoded = json.loads(values)
+        except ValueError:
+            return values, False
+        if not isinstance(decoded, list):
+            return values, False
+        return tuple(_intern(v) for v in decoded), True
+    if isinstance(values, list):
+        return tuple(_intern(v) for v in values), False
+    return values, False
+
+
+def _export_values(values, encoded):
+    if not isinstance(values, tuple):
+        return values
+    return json.dumps(list(values)) if encoded else list(values)
+
+
+class CatalogRecord:
+    __slots__ = CATALOG_FIELDS + ("encoded", "extra")
+
+    def __init__(self, row: dict):
+        row = dict(row)
+        self.product_id = row.pop("product_id")
+        self.name = row.pop("name", None)
+        self.brand = _intern(row.pop("brand", None))
+        self.image_url = row.pop("image_url", None)
+        self.description = row.pop("description", None)
+        self.keywords = row.pop("keywords", None)
+        self.categories = row.pop("categories", None)
+        self.gtin = row.pop("gtin", None)
+        self.flags = row.pop("flags", None)
+
+        self.encoded = 0
+        self.colors, colors_encoded = _intern_values(row.pop("colors", None))
+        self.sizes, sizes_encoded = _intern_values(row.pop("sizes", None))
+        if colors_encoded:
+            self.encoded |= _COLORS_ENCODED
+        if sizes_encoded:
+            self.encoded |= _SIZES_ENCODED
+
+        self.extra = row or None
+
+    def to_dict(self) -> dict:
+        product = {
+            "product_id": self.product_id,
+            "name": self.name,
+            "brand": self.brand,
+            "image_url": self.image_url,
+            "description": self.description,
+            "keywords": self.keywords,
+            "categories": self.categories,
+            "colors": _export_values(self.colors, self.encoded & _COLORS_ENCODED),
+            "sizes": _export_values(self.sizes, self.encoded & _SIZES_ENCODED),
+            "gtin": self.gtin,
+            "flags": self.flags,
+        }
+        if self.extra:
+            product.update(self.extra)
+        return product
+
+
+class ProductCatalog:
+    # In-process copy of the Supabase product table used to hydrate search
+    # hits. Supabase stays the source of truth: the catalog is loaded in
+    # keyset-paginated pages, reloaded when the table version changes, and
+    # only falls back to Supabase for IDs it has not seen yet.
+
+    def __init__(self, supabase, table: str, page_size: int = 1000, refresh_seconds: float = 60):
+        self._supabase = supabase
+        self._table = table
+        self._page_size = page_size
+        self._refresh_seconds = refresh_seconds
+        self._records = {}
+        # IDs Supabase didn't have when last asked (e.g. still in Qdrant
+        # after a row was deleted); cleared on every reload
+        self._unknown = set()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._warned_no_updated_at = False
+        self.version = None
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def _iter_rows(self):
+        last_id = None
+        while True:
+            query = (
+                self._supabase
+                .table(self._table)
+                .select("*")
+                .order("product_id")
+                .limit(self._page_size)
+            )
+            if last_id is not None:
+                query = query.gt("product_id", last_id)
+            with timed("supabase_read"):
+                rows = query.execute().data
+            yield from rows
+            if len(rows) < self._page_size:
+                return
+            last_id = rows[-1]["product_id"]
+
+    def _latest_updated_at(self):
+        res = (
+            self._supabase
+            .table(self._table)
+            .select(UPDATED_AT_COLUMN)
+            .not_.is_(UPDATED_AT_COLUMN, "null")
+            .order(UPDATED_AT_COLUMN, desc=True)
+            .limit(1)
+            .execute()
+        )
+        return res.data[0][UPDATED_AT_COLUMN] if res.data else None
+
+    def fetch_version(self):
+        # Row count catches inserts and deletes; the newest updated_at catches
+        # rows upserted in place (replay, retry-failed)
+        count = self._supabase.table(self._table).select("product_id", count="exact").limit(1).execute().count
+        try:
+            updated_at = self._latest_updated_at()
+        except Exception as e:
+            if getattr(e, "code", None) != UNDEFINED_COLUMN:
+                raise
+            # Without the column only inserts and deletes are noticed
+            if not self._warned_no_updated_at:
+                print(f"[!] {self._table}.{UPDATED_AT_COLUMN} is missing; apply supabase/migrations. "
+                      f"Rows updated in place won't refresh the catalog until then.")
+                self._warned_no_updated_at = True
+            return str(count)
+        return f"{count}:{updated_at}"
+
+    def load(self):
+        with self._lock:
+            version = self.fetch_version()
+            started = time.perf_counter()
+            records = {}
+            for row in self._iter_rows():
+                record = CatalogRecord(row)
+                records[record.product_id] = record
+            # Swap in one assignment so readers never see a half-built catalog
+            self._records = records
+            self._unknown = set()
+            self.version = version
+            self.loaded_at = time.time()
+        print(f"Loaded {len(records)} products into catalog in {time.perf_counter() - started:.1f}s")
+
+    def refresh_if_changed(self) -> bool:
+        if self.fetch_version() == self.version:
+            return False
+        self.load()
+        return True
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self._refresh_seconds)
+            try:
+                self.refresh_if_changed()
+            except Exception as e:
+                print(f"[!] Catalog refresh failed, serving version {self.version}: {e}")
+
+    def _start_refresher(self):
+        if self._refresher is None and self._refresh_seconds > 0:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="catalog-refresh", daemon=True)
+            self._refresher.start()
+
+    def start(self):
+        self.load()
+        self._start_refresher()
+
+    def after_fork(self, supabase):
+        # In a forked worker: keep the rows loaded by the parent (shared
+        # copy-on-write) but use this process's client, a fresh lock (the
+        # refresh thread may have held it at fork time) and a new refresh
+        # thread, since threads don't survive fork
+        self._supabase = supabase
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._start_refresher()
+
+    def _fetch_missing(self, product_ids):
+        with timed("supabase_read"):
+            res = self._supabase.table(self._table).select("*").in_("product_id", product_ids).execute()
+        records = self._records
+        for row in res.data:
+            record = CatalogRecord(row)
+            records[record.product_id] = record
+        unknown = self._unknown
+        if len(unknown) >= MAX_UNKNOWN_IDS:
+            unknown.clear()
+        unknown.update(pid for pid in product_ids if pid not in records)
+
+    def hydrate(self, product_ids) -> list:
+        records = self._records
+        unknown = self._unknown
+        missing = [pid for pid in product_ids if pid not in records and pid not in unknown]
+        cache_result("catalog", True, len(product_ids) - len(missing))
+        cache_result("catalog", False, len(missing))
+        if missing:
+            self._fetch_missing(missing)
+            records = self._records
+        return [records[pid].to_dict() for pid in product_ids if pid in records]
+
+    def iter_hydrate(self, product_ids, chunk_size: int = 20):
+        # Same rows as hydrate(), yielded a chunk at a time so a caller can
+        # stream the first results before later misses are fetched
+        product_ids = list(product_ids)
+        for start in range(0, len(product_ids), chunk_size):
+            yield from self.hydrate(product_ids[start:start + chunk_size])
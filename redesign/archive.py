@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows; appends there are only safe from a single process
+    fcntl = None
+
+# Local archive of raw GetProduct responses so extraction changes can be
+# replayed without re-fetching from the supplier.
+#
+# Layout, per supplier:
+#   <root>/<supplier>/segment-000001.zst   independent zstd frames, appended
+#   <root>/<supplier>/index.jsonl          one line per frame:
+#       {"product_id", "fetched_at", "segment", "offset", "length"}
+#
+# A frame is written and flushed before its index line, so the index never
+# points at data that is not on disk. Several processes may append to one
+# supplier's archive (e.g. --shard slices on one host): each append holds an
+# exclusive flock on the index file and takes its offset from the real end
+# of the segment.
+
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResponseArchive:
+    def __init__(self, root, supplier, level=3, segment_max_bytes=SEGMENT_MAX_BYTES):
+        if zstandard is None:
+            raise RuntimeError("The response archive needs the 'zstandard' package (pip install zstandard)")
+        self.supplier = supplier
+        self.path = os.path.join(root, supplier)
+        self.index_path = os.path.join(self.path, "index.jsonl")
+        self.level = level
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._segment = None
+        self._segment_file = None
+        self._index_file = None
+        self._latest = None
+        os.makedirs(self.path, exist_ok=True)
+
+    def _segment_path(self, number):
+        return os.path.join(self.path, f"segment-{number:06d}.zst")
+
+    def _compressor(self):
+        # zstd (de)compressor objects are not thread-safe; keep one per thread
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.decompressor = zstandard.ZstdDecompressor()
+        return self._local.compressor
+
+    def _decompressor(self):
+        self._compressor()
+        return self._local.decompressor
+
+    def _open_for_append(self):
+        # Called with the file lock held, so the segment's end can't move
+        if self._segment is None:
+            existing = sorted(f for f in os.listdir(self.path) if f.startswith("segment-"))
+            self._segment = int(existing[-1][8:14]) if existing else 1
+        if self._segment_file is None:
+            self._segment_file = open(self._segment_path(self._segment), "ab")
+        # Another process may have appended or moved on to later segments;
+        # skip full ones until this one catches up
+        while self._segment_file.seek(0, os.SEEK_END) >= self.segment_max_bytes:
+            self._segment_file.close()
+            self._segment += 1
+            self._segment_file = open(self._segment_path(self._segment), "ab")
+        return self._segment_file.tell()
+
+    def write(self, product_id, raw: bytes, fetched_at=None):
+        frame = self._compressor().compress(raw)
+        with self._lock:
+            if self._index_file is None:
+                self._index_file = open(self.index_path, "a", encoding="utf-8")
+            # The thread lock covers this process; flock covers the others
+            if fcntl is not None:
+                fcntl.flock(self._index_file.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = self._open_for_append()
+                self._segment_file.write(frame)
+                self._segment_file.flush()
+                entry = {
+                    "product_id": product_id,
+                    "fetched_at": fetched_at or time.time(),
+                    "segment": self._segment,
+                    "offset": offset,
+                    "length": len(frame),
+                }
+                self._index_file.write(json.dumps(entry) + "\n")
+                self._index_file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._index_file.fileno(), fcntl.LOCK_UN)
+            if self._latest is not None:
+                self._latest[product_id] = entry
+
+    def close(self):
+        with self._lock:
+            for f in (self._segment_file, self._index_file):
+                if f is not None:
+                    f.close()
+            self._segment_file = self._index_file = None
+
+    def entries(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                # A crash mid-write can leave a partial last line
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def latest(self) -> dict:
+        # Most recent frame per product ID
+        with self._lock:
+            if self._latest is None:
+                latest = {}
+                for entry in self.entries():
+                    current = latest.get(entry["product_id"])
+                    if current is None or entry["fetched_at"] >= current["fetched_at"]:
+                        latest[entry["product_id"]] = entry
+                self._latest = latest
+            return self._latest
+
+    def product_ids(self):
+        return list(self.latest())
+
+    def read_entry(self, entry) -> bytes:
+        with open(self._segment_path(entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            frame = f.read(entry["length"])
+        return self._decompressor().decompress(frame)
+
+    def read(self, product_id):
+        entry = self.latest().get(product_id)
+        return None if entry is None else self.read_entry(entry)
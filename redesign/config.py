@@ -6,11 +6,18 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_TABLE = "search_engine"
+# The database sets updated_at on every insert and update (see
+# supabase/migrations); the frontend catalog and embedding.py's rebuild
+# catch-up rely on it
 
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = "products"
 VECTOR_DIM = 1536
+# Comma-separated product fields kept in Qdrant point payloads (empty for the
+# default in qdrant_payload.py), and whether new collections keep payloads on disk
+QDRANT_PAYLOAD_FIELDS = os.getenv("QDRANT_PAYLOAD_FIELDS", "")
+QDRANT_ON_DISK_PAYLOAD = os.getenv("QDRANT_ON_DISK_PAYLOAD", "").lower() in ("1", "true", "yes")
 
 SOAP_URL_SANMAR = os.getenv("SOAP_URL_SANMAR")
 SOAP_ID_SANMAR = os.getenv("SOAP_ID_SANMAR")
@@ -19,6 +26,32 @@ SOAP_URL_EDWARDS = os.getenv("SOAP_URL_EDWARDS")
 SOAP_ID_EDWARDS = os.getenv("SOAP_ID_EDWARDS")
 SOAP_PASSWORD_EDWARDS = os.getenv("SOAP_PASSWORD_EDWARDS")
 
+# Outbound rate limits (requests per second) and concurrency per endpoint.
+# The scheduler backs off below these on 429s and climbs back up to them.
+# The top-level scripts (embedding.py, sanmar_data_import.py) import these
+# as redesign.config too, so there is one scheduler policy.
+SOAP_RATE_SANMAR = float(os.getenv("SOAP_RATE_SANMAR", "5"))
+SOAP_CONCURRENCY_SANMAR = int(os.getenv("SOAP_CONCURRENCY_SANMAR", "4"))
+SOAP_RATE_EDWARDS = float(os.getenv("SOAP_RATE_EDWARDS", "5"))
+SOAP_CONCURRENCY_EDWARDS = int(os.getenv("SOAP_CONCURRENCY_EDWARDS", "4"))
+# OPENAI_RATE is the account-wide limit for one run: `main.py sync` splits it
+# evenly between its supplier workers. Runs started separately (e.g. --shard
+# slices on other hosts) each assume the whole rate; lower it to match.
+OPENAI_RATE = float(os.getenv("OPENAI_RATE", "50"))
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "8"))
+REQUEST_MAX_RETRIES = int(os.getenv("REQUEST_MAX_RETRIES", "5"))
+SOAP_TIMEOUT = float(os.getenv("SOAP_TIMEOUT", "60"))
+
+# Raw GetProduct responses are archived here when a sync runs with --archive
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "response_archive")
+
+# Per-stage timings and counters are written here at the end of every run
+RUN_SUMMARY_DIR = os.getenv("RUN_SUMMARY_DIR", "run_summaries")
+
+# Products that fail to ingest are recorded here for `main.py retry-failed`
+DEAD_LETTER_DB = os.getenv("DEAD_LETTER_DB", "dead_letter.sqlite3")
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
 
 HEADERS = {'Content-Type': 'text/xml'}
 SANMAR_SOAP_NAMESPACES = {
@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+import time
+
+# Persistent record of products that failed to ingest, so they can be
+# retried on their own instead of waiting for the next full sync.
+#
+# One row per (supplier, product_id) holding the latest failure reason and
+# how many attempts have failed so far. A row is removed as soon as the
+# product is processed successfully.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    supplier        TEXT NOT NULL,
+    product_id      TEXT NOT NULL,
+    reason          TEXT,
+    attempts        INTEGER NOT NULL DEFAULT 1,
+    first_failed_at REAL NOT NULL,
+    last_failed_at  REAL NOT NULL,
+    PRIMARY KEY (supplier, product_id)
+)
+"""
+
+
+class DeadLetterStore:
+    def __init__(self, path):
+        self.path = path
+        # Shared by the pipeline's worker threads; writes are serialized by
+        # the lock, and the timeout covers other supplier processes
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+
+    def record_failure(self, supplier, product_id, reason):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO dead_letters (supplier, product_id, reason, attempts, first_failed_at, last_failed_at)
+                VALUES (?, ?, ?, 1, ?, ?)
+                ON CONFLICT (supplier, product_id) DO UPDATE SET
+                    reason = excluded.reason,
+                    attempts = attempts + 1,
+                    last_failed_at = excluded.last_failed_at
+                """,
+                (supplier, product_id, reason, now, now),
+            )
+
+    def resolve(self, supplier, product_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM dead_letters WHERE supplier = ? AND product_id = ?",
+                               (supplier, product_id))
+
+    def pending(self, supplier, max_attempts=None):
+        # Product IDs still worth retrying, oldest failure first
+        query = "SELECT product_id FROM dead_letters WHERE supplier = ?"
+        params = [supplier]
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params.append(max_attempts)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY first_failed_at", params).fetchall()
+        return [row[0] for row in rows]
+
+    def entries(self, supplier=None):
+        query = "SELECT supplier, product_id, reason, attempts, first_failed_at, last_failed_at FROM dead_letters"
+        params = []
+        if supplier is not None:
+            query += " WHERE supplier = ?"
+            params.append(supplier)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY supplier, product_id", params).fetchall()
+        keys = ("supplier", "product_id", "reason", "attempts", "first_failed_at", "last_failed_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,37 @@
+import threading
+from functools import wraps
+
+# The one accessor idiom for clients and other expensive singletons: built
+# on first use, once per process, and shared by all of its threads.
+#
+# Standard library only, so the top-level scripts can import it as
+# redesign.lazy.
+
+
+def per_process(factory):
+    state = {"lock": threading.Lock()}
+
+    @wraps(factory)
+    def accessor():
+        if "instance" not in state:
+            with state["lock"]:
+                if "instance" not in state:
+                    state["instance"] = factory()
+        return state["instance"]
+
+    def peek():
+        # The instance if it has been built, without building it
+        return state.get("instance")
+
+    def reset(keep=False):
+        # After fork: always replace the lock, which another thread may have
+        # held at fork time; drop the instance unless `keep`
+        instance = state.get("instance")
+        state.clear()
+        state["lock"] = threading.Lock()
+        if keep and instance is not None:
+            state["instance"] = instance
+
+    accessor.peek = peek
+    accessor.reset = reset
+    return accessor
@@ -1,49 +1,411 @@
 from supabase_store import upsert_to_supabase, product_exists
-from vector_store import generate_embedding, upsert_to_qdrant
-from soap_client import get_client
+from vector_store import generate_embedding, upsert_to_qdrant, init_collection, configure_openai
+from soap_client import get_client, parse_product, SUPPLIERS
+from pipeline import IngestPipeline, format_stage
+from archive import ResponseArchive
+from dead_letter import DeadLetterStore
+from config import ARCHIVE_DIR, RUN_SUMMARY_DIR, DEAD_LETTER_DB, RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY
+from functools import partial
+import argparse
+import glob
+import json
+import metrics
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
 import uuid
 
+PROGRESS_INTERVAL = 10
+MAX_RETRY_DELAY = 60
+
 def get_point_id(product_id_str):
     # Use UUID5 (namespace + name) to deterministically generate UUID from string ID
     namespace = uuid.NAMESPACE_OID
     return str(uuid.uuid5(namespace, product_id_str))
 
 
-def process_products(supplier):
-    soap_client = get_client(supplier)
-    product_ids = soap_client.get_sellable_product_ids()
-    print(f"Found {len(product_ids)} unique sellable product IDs")
+def parse_shard(spec):
+    # "i/N": this worker takes slice i (0-based) of N
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..N-1, got {spec!r}")
+    return index, count
+
+
+def in_shard(product_id, shard):
+    # Same UUID5 as the Qdrant point ID, so the split is stable across hosts
+    # and runs and needs no coordination
+    index, count = shard
+    return uuid.UUID(get_point_id(product_id)).int % count == index
+
+
+class ProgressReport:
+    # Aggregates progress events from every supplier worker and prints
+    # counts and throughput per supplier plus an overall total
+    EVENTS = ("processed", "skipped", "failed")
+
+    def __init__(self, suppliers):
+        self.started = time.monotonic()
+        self.stats = {s: {"total": 0, "processed": 0, "skipped": 0, "failed": 0, "done": False} for s in suppliers}
+        self.stages = {}
+
+    def update(self, supplier, event, value=1):
+        stats = self.stats[supplier]
+        if event == "total":
+            stats["total"] = value
+        elif event == "done":
+            stats["done"] = True
+        elif event == "stages":
+            self.stages[supplier] = value
+        else:
+            stats[event] += value
+
+    def line(self, supplier, stats, elapsed):
+        completed = sum(stats[e] for e in self.EVENTS)
+        rate = completed / elapsed if elapsed else 0.0
+        state = "done" if stats.get("done") else f"{rate:.1f}/s"
+        return (f"[{supplier}] {completed}/{stats['total']} | processed {stats['processed']} "
+                f"skipped {stats['skipped']} failed {stats['failed']} | {state}")
+
+    def emit(self):
+        elapsed = time.monotonic() - self.started
+        totals = {k: sum(s[k] for s in self.stats.values()) for k in ("total",) + self.EVENTS}
+        for supplier, stats in self.stats.items():
+            print(self.line(supplier, stats, elapsed))
+            for stage in self.stages.get(supplier, []):
+                print(f"    {format_stage(stage)}")
+        print(self.line("all", totals, elapsed) + f" | {elapsed:.0f}s elapsed")
+
+
+def store_product(data):
+    # Upsert to Supabase
+    upsert_to_supabase(data)
+
+    # Prepare embedding input
+    text = " ".join([
+        data.get("name", ""),
+        data.get("brand", ""),
+        data.get("description", ""),
+        ", ".join(data.get("keywords", [])),
+        ", ".join(data.get("categories", []))
+    ])
+
+    vector = generate_embedding(text)
+
+    # Upsert into Qdrant
+    point_id = get_point_id(data["product_id"])
+    upsert_to_qdrant(point_id, vector, data)
+
+
+def process_products(supplier, progress=None, fetch_workers=4, parse_workers=2, store_workers=4,
+                     queue_size=64, report_interval=PROGRESS_INTERVAL, archive_dir=None, replay=False,
+                     retry=False, max_attempts=RETRY_MAX_ATTEMPTS, retry_delay=RETRY_BASE_DELAY, shard=None,
+                     refetch=False):
+    # `progress` is an optional queue receiving (supplier, event, value) tuples.
+    # With `archive_dir`, raw responses are archived as they are fetched; with
+    # `replay`, products are read back from that archive instead of the
+    # supplier and re-parsed and stored even if they already exist. Products
+    # already in Supabase are normally skipped before fetching, so they only
+    # reach the archive when `refetch` fetches (and re-stores) everything.
+    # Failures always go to the dead-letter store. With `retry`, only the
+    # products in it are processed, in rounds with exponential backoff between
+    # them, until each succeeds or has failed `max_attempts` times.
+    # With `shard=(i, N)`, only products that hash to slice i are handled.
+    def report(event, value=1):
+        if progress is not None:
+            progress.put((supplier, event, value))
+
+    metrics.set_supplier(supplier)
+    started = time.time()
+    archive = ResponseArchive(archive_dir, supplier) if archive_dir else None
+    dead_letters = DeadLetterStore(DEAD_LETTER_DB)
+
+    if replay:
+        product_ids = archive.product_ids()
+        print(f"Replaying {len(product_ids)} archived products")
+
+        def fetch(pid):
+            with metrics.timed("archive_read"):
+                return archive.read(pid)
+    else:
+        soap_client = get_client(supplier)
+        if retry:
+            product_ids = dead_letters.pending(supplier, max_attempts)
+            print(f"Retrying {len(product_ids)} failed products")
+        else:
+            product_ids = soap_client.get_sellable_product_ids()
+            print(f"Found {len(product_ids)} unique sellable product IDs")
+
+        def fetch(pid):
+            # A failed product may have reached Supabase before failing
+            # later on, so retries never skip existing rows
+            check_existing = not (retry or refetch)
+            exists = check_existing and product_exists(pid)
+            if check_existing:
+                metrics.cache_result("existing_product", exists)
+            if exists:
+                print(f"✅ {pid} already exists in Supabase. Skipping.")
+                return None
+            raw = soap_client.fetch_product_xml(pid)
+            if archive is not None:
+                archive.write(pid, raw)
+            return raw
+
+    def select(ids):
+        if shard is None:
+            return ids
+        selected = [pid for pid in ids if in_shard(pid, shard)]
+        print(f"Shard {shard[0]}/{shard[1]}: {len(selected)} of {len(ids)} products")
+        return selected
+    product_ids = select(product_ids)
+
+    # Products still failing at the end of this run, for the run summary
+    failures = {}
+    failures_lock = threading.Lock()
+
+    def on_outcome(pid, outcome, reason=None):
+        if outcome == "processed":
+            print(f"🔄 Processed and uploaded: {pid}")
+            dead_letters.resolve(supplier, pid)
+            with failures_lock:
+                failures.pop(pid, None)
+        elif outcome == "failed":
+            print(f"❌ Failed to process {pid}: {reason}")
+            dead_letters.record_failure(supplier, pid, reason)
+            with failures_lock:
+                failures[pid] = reason
+        metrics.PRODUCTS.inc(supplier=supplier, outcome=outcome)
+        report(outcome)
+
+    def on_stats(stats):
+        if progress is not None:
+            report("stages", stats)
+        else:
+            for line in map(format_stage, stats):
+                print(line)
+
+    attempted = 0
+    retry_round = 0
+    try:
+        while True:
+            attempted += len(product_ids)
+            report("total", attempted)
+            pipeline = IngestPipeline(
+                fetch, partial(parse_product, supplier), store_product,
+                fetch_workers=fetch_workers, parse_workers=parse_workers, store_workers=store_workers,
+                queue_size=queue_size, on_outcome=on_outcome, on_stats=on_stats, stats_interval=report_interval,
+            )
+            stages = pipeline.run(product_ids)
+            if not retry:
+                break
+            product_ids = select(dead_letters.pending(supplier, max_attempts))
+            if not product_ids:
+                break
+            delay = min(retry_delay * 2 ** retry_round, MAX_RETRY_DELAY)
+            retry_round += 1
+            print(f"{len(product_ids)} products still failing; retry round {retry_round} in {delay:g}s")
+            time.sleep(delay)
+        if retry:
+            exhausted = len(dead_letters.entries(supplier)) - len(dead_letters.pending(supplier, max_attempts))
+            if exhausted:
+                print(f"[!] {exhausted} products reached {max_attempts} attempts and were left in {DEAD_LETTER_DB}")
+    finally:
+        if archive is not None:
+            archive.close()
+        dead_letters.close()
+    write_run_summary(supplier, started, stages, shard, failures)
+    report("done")
+
+
+def write_run_summary(supplier, started, stages, shard=None, failures=None):
+    # JSON for tooling (and `main.py merge`) plus a Prometheus text file next
+    # to it, which a node_exporter textfile collector can pick up
+    os.makedirs(RUN_SUMMARY_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(started))
+    name = f"{supplier}-shard{shard[0]}of{shard[1]}-{stamp}" if shard else f"{supplier}-{stamp}"
+    path = os.path.join(RUN_SUMMARY_DIR, name + ".json")
+    summary = metrics.write_summary(
+        path, supplier=supplier, shard=list(shard) if shard else None, host=socket.gethostname(),
+        started_at=started, finished_at=time.time(), pipeline=stages,
+        failures=[{"product_id": pid, "reason": reason} for pid, reason in sorted((failures or {}).items())],
+    )
+    print(f"[{supplier}] run summary:")
+    print(metrics.format_summary(summary))
+    print(f"[{supplier}] summary written to {path}")
+
+
+def _supplier_worker(supplier, progress, options, openai_share=1.0):
+    # Runs in its own process: clients, connection pools and scheduler
+    # buckets are created fresh on import and never shared across suppliers.
+    # OpenAI's limit is per account, so each worker only gets its share.
+    configure_openai(openai_share)
+    try:
+        process_products(supplier, progress=progress, **options)
+    except Exception as e:
+        print(f"❌ Sync for {supplier} aborted: {e}")
+        progress.put((supplier, "done", 1))
+        raise
+
+
+def sync(suppliers, report_interval=PROGRESS_INTERVAL, **options):
+    # "spawn" so every worker opens its own sockets instead of inheriting ours
+    ctx = multiprocessing.get_context("spawn")
+    progress = ctx.Queue()
+    options = dict(options, report_interval=report_interval)
+    workers = [
+        ctx.Process(target=_supplier_worker, args=(s, progress, options, 1 / len(suppliers)), name=f"sync-{s}")
+        for s in suppliers
+    ]
+    for w in workers:
+        w.start()
+
+    report = ProgressReport(suppliers)
+    next_report = time.monotonic() + report_interval
+    while any(w.is_alive() for w in workers) or not progress.empty():
+        try:
+            report.update(*progress.get(timeout=1))
+        except queue.Empty:
+            pass
+        if time.monotonic() >= next_report:
+            report.emit()
+            next_report += report_interval
+
+    for w in workers:
+        w.join()
+    report.emit()
+    return all(w.exitcode == 0 for w in workers)
+
+
+def list_failures(suppliers):
+    store = DeadLetterStore(DEAD_LETTER_DB)
+    try:
+        for supplier in suppliers:
+            for entry in store.entries(supplier):
+                failed_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_failed_at"]))
+                print(f"[{supplier}] {entry['product_id']} attempts={entry['attempts']} "
+                      f"last={failed_at} {entry['reason']}")
+    finally:
+        store.close()
+
+
+def merge_run_summaries(paths):
+    # Combine run summaries from shard workers (copied over from each host)
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path])
+    runs = []
+    for path in files:
+        with open(path) as f:
+            runs.append(json.load(f))
+    if not runs:
+        raise SystemExit("No run summaries found")
+
+    merged = metrics.merge_snapshots(runs)
+    merged["runs"] = [{key: run.get(key) for key in ("supplier", "shard", "host", "started_at", "finished_at")}
+                      for run in runs]
+    merged["started_at"] = min(run["started_at"] for run in runs)
+    merged["finished_at"] = max(run["finished_at"] for run in runs)
+    merged["failures"] = sorted(
+        ({"supplier": run["supplier"], **failure} for run in runs for failure in run.get("failures", [])),
+        key=lambda f: (f["supplier"], f["product_id"]),
+    )
+
+    # Point out shards that are missing or were run more than once
+    warnings = []
+    for supplier in sorted({run["supplier"] for run in runs}):
+        shards = [tuple(run["shard"]) for run in runs if run["supplier"] == supplier and run.get("shard")]
+        for count in sorted({n for _, n in shards}):
+            seen = [i for i, n in shards if n == count]
+            missing = sorted(set(range(count)) - set(seen))
+            repeated = sorted({i for i in seen if seen.count(i) > 1})
+            if missing:
+                warnings.append(f"{supplier}: missing shards {missing} of {count}")
+            if repeated:
+                warnings.append(f"{supplier}: shards {repeated} of {count} appear more than once")
+    merged["warnings"] = warnings
+    return merged
+
+
+def _add_pipeline_arguments(parser):
+    parser.add_argument("suppliers", nargs="+", choices=sorted(SUPPLIERS),
+                        help="suppliers to process; each runs in its own worker process with an equal share "
+                             "of OPENAI_RATE")
+    parser.add_argument("--fetch-workers", type=int, default=4,
+                        help="SOAP fetch threads per supplier (default: %(default)s)")
+    parser.add_argument("--parse-workers", type=int, default=2,
+                        help="XML parser processes per supplier (default: %(default)s)")
+    parser.add_argument("--store-workers", type=int, default=4,
+                        help="Supabase/embedding/Qdrant threads per supplier (default: %(default)s)")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="capacity of each queue between stages (default: %(default)s)")
+    parser.add_argument("--report-interval", type=float, default=PROGRESS_INTERVAL,
+                        help="seconds between progress reports (default: %(default)s)")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="only handle products in slice i of N; run one worker per slice")
+
 
-    for pid in product_ids:
-        if product_exists(pid):
-            print(f"✅ {pid} already exists in Supabase. Skipping.")
-            continue
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync supplier catalogs into Supabase and Qdrant")
+    commands = parser.add_subparsers(dest="command", required=True)
 
-        data = soap_client.fetch_product_data(pid)
-        if not data:
-            print(f"❌ Failed to fetch or parse data for {pid}")
-            continue
+    sync_parser = commands.add_parser("sync", help="fetch products from the suppliers")
+    _add_pipeline_arguments(sync_parser)
+    sync_parser.add_argument("--archive", nargs="?", const=ARCHIVE_DIR, default=None, metavar="DIR",
+                             help=f"archive raw GetProduct responses (default dir: {ARCHIVE_DIR}); only fetched "
+                                  f"products are archived, so seed a new archive with --refetch")
+    sync_parser.add_argument("--refetch", action="store_true",
+                             help="fetch and store every sellable product, including ones already in Supabase")
 
-        # Upsert to Supabase
-        upsert_to_supabase(data)
+    replay_parser = commands.add_parser("replay", help="re-parse and store archived responses, no supplier traffic")
+    _add_pipeline_arguments(replay_parser)
+    replay_parser.add_argument("--archive", default=ARCHIVE_DIR, metavar="DIR",
+                               help="archive to replay from (default: %(default)s)")
 
-        # Prepare embedding input
-        text = " ".join([
-            data.get("name", ""),
-            data.get("brand", ""),
-            data.get("description", ""),
-            ", ".join(data.get("keywords", [])),
-            ", ".join(data.get("categories", []))
-        ])
+    retry_parser = commands.add_parser("retry-failed", help=f"reprocess only products in {DEAD_LETTER_DB}")
+    _add_pipeline_arguments(retry_parser)
+    retry_parser.add_argument("--max-attempts", type=int, default=RETRY_MAX_ATTEMPTS,
+                              help="give up on a product after this many failures (default: %(default)s)")
+    retry_parser.add_argument("--retry-delay", type=float, default=RETRY_BASE_DELAY,
+                              help="seconds before the first retry round, doubling each round (default: %(default)s)")
+    retry_parser.add_argument("--list", action="store_true", help="list failed products and exit")
 
-        vector = generate_embedding(text)
+    merge_parser = commands.add_parser("merge", help="combine run summaries and failure lists from shard workers")
+    merge_parser.add_argument("paths", nargs="+", metavar="PATH", help="run summary files or directories of them")
+    merge_parser.add_argument("--output", metavar="FILE", help="write the merged summary as JSON")
 
-        # Upsert into Qdrant
-        point_id = get_point_id(data["product_id"])
-        upsert_to_qdrant(point_id, vector, data)
+    args = parser.parse_args(argv)
+    if args.command == "merge":
+        merged = merge_run_summaries(args.paths)
+        print(metrics.format_summary(merged))
+        print(f"{len(merged['runs'])} runs, {len(merged['failures'])} failed products")
+        for warning in merged["warnings"]:
+            print(f"[!] {warning}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(merged, f, indent=2)
+            print(f"Merged summary written to {args.output}")
+        return
+    suppliers = list(dict.fromkeys(args.suppliers))
+    retry_options = {}
+    if args.command == "retry-failed":
+        if args.list:
+            list_failures(suppliers)
+            return
+        retry_options = dict(retry=True, max_attempts=args.max_attempts, retry_delay=args.retry_delay)
+    # Once, up front, rather than on import in every worker
+    init_collection()
+    ok = sync(suppliers, report_interval=args.report_interval, fetch_workers=args.fetch_workers,
+              parse_workers=args.parse_workers, store_workers=args.store_workers, queue_size=args.queue_size,
+              archive_dir=getattr(args, "archive", None), replay=args.command == "replay", shard=args.shard,
+              refetch=getattr(args, "refetch", False), **retry_options)
+    raise SystemExit(0 if ok else 1)
 
-        print(f"🔄 Processed and uploaded: {pid}")
 
 if __name__ == "__main__":
-    process_products("edwards")
-    # process_products("sanmar")
+    main()
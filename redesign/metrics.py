@@ -0,0 +1,258 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics: counters and histograms with labels, rendered
+# in the Prometheus text exposition format and as an end-of-run summary.
+# Standard library only, so the frontend can import it as redesign.metrics.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = []
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_label_str(self.labels, key)} {value}")
+        return lines
+
+
+def _quantile(bounds, buckets, count, largest, q):
+    # Upper bound of the bucket holding the q-th observation, capped at the
+    # largest value actually seen
+    target = q * count
+    seen = 0
+    for bound, n in zip(bounds, buckets):
+        seen += n
+        if seen >= target:
+            return min(bound, largest)
+    return largest
+
+
+def _stage_entry(stage, supplier, bounds, buckets, count, errors, total, largest):
+    return {
+        "stage": stage,
+        "supplier": supplier,
+        "count": count,
+        "errors": errors,
+        "total_seconds": total,
+        "mean_seconds": total / count if count else 0.0,
+        "p50_seconds": _quantile(bounds, buckets, count, largest, 0.5),
+        "p99_seconds": _quantile(bounds, buckets, count, largest, 0.99),
+        "max_seconds": largest,
+        # Raw counts (observations <= each bound) so summaries can be merged
+        "buckets": list(buckets),
+    }
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0, "max": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+            state["max"] = max(state["max"], value)
+
+    def samples(self):
+        with self._lock:
+            return {k: {**v, "buckets": list(v["buckets"])} for k, v in self._values.items()}
+
+    def quantile(self, state, q):
+        return _quantile(self.buckets, state["buckets"], state["count"], state["max"], q)
+
+    def render(self):
+        lines = []
+        for key, state in sorted(self.samples().items()):
+            cumulative = 0
+            bounds = [str(b) for b in self.buckets] + ["+Inf"]
+            counts = state["buckets"] + [state["count"] - sum(state["buckets"])]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {state['sum']}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "search_engine_stage_seconds", "Time spent in each stage of ingestion and search.", ("stage", "supplier"))
+STAGE_ERRORS = registry.counter(
+    "search_engine_stage_errors_total", "Stage calls that raised, by stage and supplier.", ("stage", "supplier"))
+CACHE_REQUESTS = registry.counter(
+    "search_engine_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result"))
+PRODUCTS = registry.counter(
+    "search_engine_products_total", "Products handled by ingestion, by supplier and outcome.", ("supplier", "outcome"))
+HTTP_SECONDS = registry.histogram(
+    "search_engine_http_request_seconds", "Frontend request latency by route and status.", ("route", "status"))
+
+# Each ingestion worker process handles one supplier; stages that don't
+# know their supplier (embedding, Supabase, Qdrant) are labelled with it
+_default_supplier = ""
+
+
+def set_supplier(supplier):
+    global _default_supplier
+    _default_supplier = supplier
+
+
+@contextmanager
+def timed(stage, supplier=None):
+    supplier = _default_supplier if supplier is None else supplier
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage, supplier=supplier)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage, supplier=supplier)
+
+
+def cache_result(cache, hit, count=1):
+    if count:
+        CACHE_REQUESTS.inc(count, cache=cache, result="hit" if hit else "miss")
+
+
+def render():
+    return registry.render()
+
+
+def snapshot():
+    # JSON-friendly view of every stage, counter and cache, for run summaries
+    stages = []
+    errors = STAGE_ERRORS.samples()
+    for (stage, supplier), state in sorted(STAGE_SECONDS.samples().items()):
+        stages.append(_stage_entry(stage, supplier, STAGE_SECONDS.buckets, state["buckets"], state["count"],
+                                   errors.get((stage, supplier), 0), state["sum"], state["max"]))
+    return {
+        "bucket_bounds": list(STAGE_SECONDS.buckets),
+        "stages": stages,
+        "products": [{"supplier": s, "outcome": o, "count": c} for (s, o), c in sorted(PRODUCTS.samples().items())],
+        "cache": [{"cache": c, "result": r, "count": n} for (c, r), n in sorted(CACHE_REQUESTS.samples().items())],
+    }
+
+
+def merge_snapshots(summaries):
+    # Combine snapshots from separate runs or hosts. Bucket counts add up,
+    # so merged quantiles are as precise as each run's own.
+    bounds = tuple(summaries[0]["bucket_bounds"]) if summaries else DEFAULT_BUCKETS
+    stages, products, cache = {}, {}, {}
+    for summary in summaries:
+        if tuple(summary["bucket_bounds"]) != bounds:
+            raise ValueError("Cannot merge summaries recorded with different histogram buckets")
+        for s in summary["stages"]:
+            merged = stages.setdefault((s["stage"], s["supplier"]), {
+                "buckets": [0] * len(bounds), "count": 0, "errors": 0, "total": 0.0, "largest": 0.0})
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], s["buckets"])]
+            merged["count"] += s["count"]
+            merged["errors"] += s["errors"]
+            merged["total"] += s["total_seconds"]
+            merged["largest"] = max(merged["largest"], s["max_seconds"])
+        for p in summary["products"]:
+            key = (p["supplier"], p["outcome"])
+            products[key] = products.get(key, 0) + p["count"]
+        for c in summary["cache"]:
+            key = (c["cache"], c["result"])
+            cache[key] = cache.get(key, 0) + c["count"]
+    return {
+        "bucket_bounds": list(bounds),
+        "stages": [_stage_entry(stage, supplier, bounds, **m) for (stage, supplier), m in sorted(stages.items())],
+        "products": [{"supplier": s, "outcome": o, "count": c} for (s, o), c in sorted(products.items())],
+        "cache": [{"cache": c, "result": r, "count": n} for (c, r), n in sorted(cache.items())],
+    }
+
+
+def format_summary(summary):
+    def ms(seconds):
+        return f"{seconds * 1000:.1f}ms"
+
+    lines = [f"{'stage':<16} {'supplier':<10} {'count':>8} {'errors':>7} {'mean':>10} {'p50':>10} {'p99':>10} {'total':>10}"]
+    for s in summary["stages"]:
+        lines.append(f"{s['stage']:<16} {s['supplier']:<10} {s['count']:>8} {s['errors']:>7} {ms(s['mean_seconds']):>10} "
+                     f"{ms(s['p50_seconds']):>10} {ms(s['p99_seconds']):>10} {s['total_seconds']:>9.1f}s")
+    for p in summary["products"]:
+        lines.append(f"products {p['supplier']} {p['outcome']}: {p['count']}")
+    for c in summary["cache"]:
+        lines.append(f"cache {c['cache']} {c['result']}: {c['count']}")
+    return "\n".join(lines)
+
+
+def write_summary(path, **extra):
+    summary = dict(snapshot(), **extra)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    with open(path.rsplit(".", 1)[0] + ".prom", "w") as f:
+        f.write(render())
+    return summary
@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import queue
+import threading
+import time
+
+from metrics import timed
+
+# Staged ingestion: network-bound fetch threads -> CPU-bound XML parsing in a
+# process pool -> network-bound store threads (Supabase, embeddings, Qdrant).
+# Stages are connected by bounded queues, so a slow stage blocks the one
+# feeding it instead of letting raw responses pile up in memory.
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name, workers, inbox):
+        self.name = name
+        self.workers = workers
+        self.inbox = inbox
+        self.items = 0
+        self.busy = 0.0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.items += 1
+            self.busy += seconds
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self._lock:
+            items, busy = self.items, self.busy
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": items,
+            # Share of worker time spent working rather than waiting on the
+            # inbox or on a full outbox. A stage near 100% with a full inbox
+            # is the bottleneck; add workers there.
+            "utilization": busy / (elapsed * self.workers),
+            "avg_seconds": busy / items if items else 0.0,
+            "queued": self.inbox.qsize(),
+            "queue_size": self.inbox.maxsize,
+        }
+
+
+def format_stage(stats):
+    return (f"{stats['stage']:<6} {stats['workers']:>3}w {stats['utilization']:>6.1%} busy "
+            f"{stats['items']:>7} items {stats['avg_seconds']:.3f}s avg "
+            f"| inbox {stats['queued']}/{stats['queue_size']}")
+
+
+class IngestPipeline:
+    # fetch(pid) returns raw bytes, or None to skip the product.
+    # parse(pid, raw) must be picklable (a module-level function or a
+    # functools.partial of one) because it runs in worker processes.
+    # store(data) persists one parsed product.
+    # on_outcome(pid, outcome, reason) is called once per product with
+    # outcome "processed", "skipped" or "failed".
+
+    def __init__(self, fetch, parse, store, fetch_workers=4, parse_workers=2, store_workers=4,
+                 queue_size=64, on_outcome=None, on_stats=None, stats_interval=10):
+        self.fetch = fetch
+        self.parse = parse
+        self.store = store
+        self.on_outcome = on_outcome
+        self.on_stats = on_stats
+        self.stats_interval = stats_interval
+
+        self.fetch_queue = queue.Queue(maxsize=queue_size)
+        self.parse_queue = queue.Queue(maxsize=queue_size)
+        self.store_queue = queue.Queue(maxsize=queue_size)
+        self.stages = {
+            "fetch": StageStats("fetch", fetch_workers, self.fetch_queue),
+            "parse": StageStats("parse", parse_workers, self.parse_queue),
+            "store": StageStats("store", store_workers, self.store_queue),
+        }
+
+    def stats(self):
+        return [stage.snapshot() for stage in self.stages.values()]
+
+    def _outcome(self, pid, outcome, reason=None):
+        if self.on_outcome is None:
+            return
+        # A failing callback (e.g. a locked dead-letter DB) must not kill the
+        # worker thread: with every fetch thread gone, run() would block
+        # forever feeding the fetch queue
+        try:
+            self.on_outcome(pid, outcome, reason)
+        except Exception as e:
+            print(f"[!] Outcome callback failed for {pid} ({outcome}): {e}")
+
+    def _fetch_worker(self):
+        stats = self.stages["fetch"]
+        while True:
+            pid = self.fetch_queue.get()
+            if pid is _DONE:
+                return
+            started = time.perf_counter()
+            try:
+                raw = self.fetch(pid)
+            except Exception as e:
+                stats.record(time.perf_counter() - started)
+                self._outcome(pid, "failed", f"fetch: {e}")
+                continue
+            stats.record(time.perf_counter() - started)
+            if raw is None:
+                self._outcome(pid, "skipped")
+                continue
+            self.parse_queue.put((pid, raw))
+
+    def _parse_worker(self, pool):
+        # One dispatcher thread per worker process keeps exactly
+        # parse_workers responses in flight
+        stats = self.stages["parse"]
+        while True:
+            item = self.parse_queue.get()
+            if item is _DONE:
+                return
+            pid, raw = item
+            started = time.perf_counter()
+            try:
+                with timed("xml_parse"):
+                    data = pool.submit(self.parse, pid, raw).result()
+            except Exception as e:
+                stats.record(time.perf_counter() - started)
+                self._outcome(pid, "failed", f"parse: {e}")
+                continue
+            stats.record(time.perf_counter() - started)
+            if not data:
+                self._outcome(pid, "failed", "parse: no product in response")
+                continue
+            self.store_queue.put((pid, data))
+
+    def _store_worker(self):
+        stats = self.stages["store"]
+        while True:
+            item = self.store_queue.get()
+            if item is _DONE:
+                return
+            pid, data = item
+            started = time.perf_counter()
+            try:
+                self.store(data)
+            except Exception as e:
+                stats.record(time.perf_counter() - started)
+                self._outcome(pid, "failed", f"store: {e}")
+                continue
+            stats.record(time.perf_counter() - started)
+            self._outcome(pid, "processed")
+
+    def _monitor(self, stopped):
+        while not stopped.wait(self.stats_interval):
+            try:
+                self.on_stats(self.stats())
+            except Exception as e:
+                print(f"[!] Stats callback failed: {e}")
+
+    @staticmethod
+    def _start(target, count, name, *args):
+        threads = [threading.Thread(target=target, args=args, name=f"{name}-{i}", daemon=True) for i in range(count)]
+        for t in threads:
+            t.start()
+        return threads
+
+    @staticmethod
+    def _drain(q, threads):
+        for _ in threads:
+            q.put(_DONE)
+        for t in threads:
+            t.join()
+
+    def run(self, product_ids):
+        fetch_workers = self.stages["fetch"].workers
+        parse_workers = self.stages["parse"].workers
+        store_workers = self.stages["store"].workers
+
+        stopped = threading.Event()
+        if self.on_stats is not None:
+            threading.Thread(target=self._monitor, args=(stopped,), name="pipeline-stats", daemon=True).start()
+
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=parse_workers, mp_context=ctx) as pool:
+            for stage in self.stages.values():
+                stage.started = time.monotonic()
+            fetchers = self._start(self._fetch_worker, fetch_workers, "fetch")
+            parsers = self._start(self._parse_worker, parse_workers, "parse", pool)
+            storers = self._start(self._store_worker, store_workers, "store")
+
+            # Blocks whenever the fetch stage is saturated
+            for pid in product_ids:
+                self.fetch_queue.put(pid)
+
+            # Shut stages down in order so every queued item is handled
+            self._drain(self.fetch_queue, fetchers)
+            self._drain(self.parse_queue, parsers)
+            self._drain(self.store_queue, storers)
+
+        stopped.set()
+        if self.on_stats is not None:
+            self.on_stats(self.stats())
+        return self.stats()
@@ -0,0 +1,148 @@
+import re
+import time
+import uuid
+
+from qdrant_client.models import (CollectionStatus, CreateAlias, CreateAliasOperation, DeleteAlias,
+                                  DeleteAliasOperation, Distance, HnswConfigDiff, VectorParams)
+
+# Blue/green collection management. Readers and incremental writers always
+# use the alias (e.g. "products"); full rebuilds go into a new versioned
+# collection ("products_v3") and the alias is switched over in one atomic
+# call once the new collection is complete and fully indexed.
+#
+# Like scheduler.py this only depends on qdrant_client, so the top-level
+# scripts can import it as redesign.qdrant_collections.
+
+HNSW_M = 16
+# Collection metadata key changed whenever vectors are rewritten without the
+# Supabase rows changing (embedding.py reindexes); the frontend's search
+# ETags include it
+CONTENT_VERSION_KEY = "content_version"
+
+
+def versioned_name(alias, version):
+    return f"{alias}_v{version}"
+
+
+def resolve_alias(qdrant, alias):
+    for a in qdrant.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
+
+
+def list_versions(qdrant, alias):
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    versions = []
+    for c in qdrant.get_collections().collections:
+        m = pattern.match(c.name)
+        if m:
+            versions.append((int(m.group(1)), c.name))
+    return sorted(versions)
+
+
+def ensure_collection(qdrant, name, vector_dim, on_disk_payload=None):
+    # `name` may be an alias; only create a plain collection if neither exists
+    if resolve_alias(qdrant, name) or qdrant.collection_exists(name):
+        print(f"Collection '{name}' already exists. Skipping creation.")
+        return
+    qdrant.create_collection(
+        collection_name=name,
+        vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE),
+        on_disk_payload=on_disk_payload,
+    )
+
+
+def create_build_collection(qdrant, alias, vector_dim, on_disk_payload=None):
+    versions = list_versions(qdrant, alias)
+    name = versioned_name(alias, versions[-1][0] + 1 if versions else 1)
+    # m=0 skips building the HNSW graph while points are bulk-loaded; the
+    # graph is built once at the end by finish_build
+    qdrant.create_collection(
+        collection_name=name,
+        vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE),
+        hnsw_config=HnswConfigDiff(m=0),
+        on_disk_payload=on_disk_payload,
+    )
+    print(f"Created build collection '{name}'")
+    return name
+
+
+def wait_until_green(qdrant, name, timeout=3600, poll=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = qdrant.get_collection(name).status
+        if status == CollectionStatus.GREEN:
+            return
+        if status == CollectionStatus.RED:
+            raise RuntimeError(f"Collection '{name}' is red; optimizer failed")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Collection '{name}' still {status} after {timeout}s")
+        time.sleep(poll)
+
+
+def finish_build(qdrant, name, min_count, max_count=None, timeout=3600):
+    # Turn indexing back on, wait for the graph to be built, then check the
+    # point count against the source of truth. Pass the source's row count
+    # (a range if it changed while the build ran), not what this run uploaded.
+    max_count = min_count if max_count is None else max_count
+    qdrant.update_collection(collection_name=name, hnsw_config=HnswConfigDiff(m=HNSW_M))
+    # Give the optimizer a moment to pick up the change before polling
+    time.sleep(1)
+    wait_until_green(qdrant, name, timeout=timeout)
+    count = qdrant.count(collection_name=name, exact=True).count
+    if not min_count <= count <= max_count:
+        expected = min_count if min_count == max_count else f"{min_count}-{max_count}"
+        raise RuntimeError(f"Collection '{name}' has {count} points, source has {expected} rows")
+    print(f"Build collection '{name}' indexed and validated ({count} points)")
+
+
+def switch_alias(qdrant, alias, name, drop_legacy_collection=False):
+    current = resolve_alias(qdrant, alias)
+    if current is None and qdrant.collection_exists(alias):
+        # First cutover from a plain collection: an alias can't share its
+        # name, so the old collection has to go before the alias is created
+        if not drop_legacy_collection:
+            raise RuntimeError(f"'{alias}' is a plain collection; rerun with --drop-legacy-collection "
+                               f"to replace it with an alias to '{name}'")
+        print(f"Dropping legacy collection '{alias}'")
+        qdrant.delete_collection(alias)
+
+    operations = []
+    if current is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=name, alias_name=alias)))
+    # Both operations are applied atomically
+    qdrant.update_collection_aliases(change_aliases_operations=operations)
+    print(f"Alias '{alias}' now points to '{name}' (was {current or 'unset'})")
+    return current
+
+
+def bump_content_version(qdrant, name):
+    # `name` may be an alias; metadata lives on the collection behind it
+    version = uuid.uuid4().hex
+    try:
+        qdrant.update_collection(collection_name=resolve_alias(qdrant, name) or name,
+                                 metadata={CONTENT_VERSION_KEY: version})
+    except Exception as e:
+        # Servers without collection metadata; cached search responses then
+        # only notice changes in point count, rows or alias target
+        print(f"[!] Could not record a new content version on '{name}': {e}")
+        return None
+    return version
+
+
+def content_version(info):
+    # From a get_collection() result; None if never bumped
+    return (info.config.metadata or {}).get(CONTENT_VERSION_KEY)
+
+
+def collect_garbage(qdrant, alias, keep=2):
+    # Keep the `keep` newest versions (one of which is live) for rollback
+    live = resolve_alias(qdrant, alias)
+    versions = list_versions(qdrant, alias)
+    for _, name in versions[:-keep] if keep else versions:
+        if name == live:
+            continue
+        print(f"Deleting old collection '{name}'")
+        qdrant.delete_collection(name)
@@ -0,0 +1,71 @@
+import json
+
+from qdrant_client.models import CollectionParamsDiff, OverwritePayloadOperation, SetPayload
+
+# Qdrant only needs what search filters and ranks on; full rows are
+# hydrated from Supabase (see product_catalog.py). Everything else, such as
+# descriptions, keywords and flags, is left out of the point payload.
+#
+# Like qdrant_collections.py this only depends on qdrant_client, so the
+# top-level scripts can import it as redesign.qdrant_payload.
+
+DEFAULT_PAYLOAD_FIELDS = ("product_id", "brand", "categories", "colors", "sizes")
+# Supabase can hand these back JSON-encoded; store them as lists so they
+# can be filtered on
+LIST_FIELDS = ("categories", "colors", "sizes")
+
+
+def parse_payload_fields(value):
+    # Comma-separated field list, e.g. from QDRANT_PAYLOAD_FIELDS
+    if not value:
+        return DEFAULT_PAYLOAD_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    if "product_id" not in fields:
+        # The frontend maps hits back to rows by payload product_id
+        fields = ("product_id",) + fields
+    return fields
+
+
+def project_payload(product, fields=DEFAULT_PAYLOAD_FIELDS):
+    payload = {}
+    for field in fields:
+        value = product.get(field)
+        if value is None:
+            continue
+        if field in LIST_FIELDS and isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                value = [value]
+        payload[field] = value
+    return payload
+
+
+def set_on_disk_payload(qdrant, collection_name, on_disk=True):
+    # Existing payloads move on the optimizer's next pass over each segment
+    qdrant.update_collection(collection_name=collection_name,
+                             collection_params=CollectionParamsDiff(on_disk_payload=on_disk))
+
+
+def migrate_payloads(qdrant, collection_name, fields=DEFAULT_PAYLOAD_FIELDS, batch_size=256):
+    # Rewrite every point's payload to the projection, one scroll page per
+    # request. Points that already match are left alone, so an interrupted
+    # migration can simply be run again.
+    scanned = rewritten = 0
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(collection_name=collection_name, limit=batch_size, offset=offset,
+                                       with_payload=True, with_vectors=False)
+        operations = []
+        for point in points:
+            payload = project_payload(point.payload or {}, fields)
+            if payload != point.payload:
+                operations.append(OverwritePayloadOperation(
+                    overwrite_payload=SetPayload(payload=payload, points=[point.id])))
+        if operations:
+            qdrant.batch_update_points(collection_name=collection_name, update_operations=operations, wait=True)
+        scanned += len(points)
+        rewritten += len(operations)
+        print(f"Scanned {scanned} points, rewrote {rewritten} payloads")
+        if offset is None:
+            return scanned, rewritten
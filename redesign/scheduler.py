@@ -0,0 +1,209 @@
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# Shared rate limiting and retry policy for outbound calls (supplier SOAP
+# endpoints, OpenAI). Each endpoint gets its own token bucket and concurrency
+# limit. On 429/5xx the call is retried with exponential backoff and jitter,
+# honouring Retry-After, and the endpoint's rate is cut so the whole process
+# slows down, then creeps back up while calls succeed. Endpoints can mark
+# responses as permanent failures (SOAP Faults) so they are not retried.
+#
+# This module only depends on the standard library and requests so it can
+# be imported both from redesign/ and from the top-level scripts
+# (`from redesign.scheduler import scheduler`).
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+SOAP_ENVELOPE_NAMESPACES = ("http://schemas.xmlsoap.org/soap/envelope/", "http://www.w3.org/2003/05/soap-envelope")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Endpoint:
+    # `permanent(response)` marks responses with a retryable status that
+    # retrying can't fix, e.g. SOAP Faults sent as HTTP 500
+    def __init__(self, name, rate, burst=None, concurrency=4, max_retries=5,
+                 base_delay=0.5, max_delay=60.0, min_rate=None, permanent=None):
+        self.name = name
+        self.permanent = permanent
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.bucket = TokenBucket(rate, burst or max(1.0, rate))
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+
+    def throttle(self, retry_after=None):
+        # Multiplicative decrease on overload, plus a shared pause when the
+        # server tells us how long to back off
+        with self._lock:
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def recover(self):
+        # Additive increase back towards the configured rate
+        with self._lock:
+            if self.bucket.rate < self.max_rate:
+                self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate / 50)
+
+    def wait_until_unblocked(self):
+        delay = self._blocked_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        # Full jitter: uniform in [0, base * 2^attempt]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def soap_fault(response):
+    # faultstring of a SOAP Fault response ("" if it has none), else None.
+    # PromoStandards services report errors such as an unknown productId as
+    # a Fault with HTTP 500.
+    content = getattr(response, "content", None)
+    if not content or b"Fault" not in content:
+        return None
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return None
+    for ns in SOAP_ENVELOPE_NAMESPACES:
+        fault = root.find(f".//{{{ns}}}Fault")
+        if fault is not None:
+            # SOAP 1.1 faultstring, or SOAP 1.2 Reason/Text
+            text = fault.findtext("faultstring") or fault.findtext(f".//{{{ns}}}Text")
+            return (text or "").strip()
+    return None
+
+
+def is_soap_fault(response):
+    return soap_fault(response) is not None
+
+
+def _status_and_headers(obj):
+    # Works for requests.Response, requests.HTTPError and the OpenAI SDK's
+    # APIStatusError, which all expose a status code and response headers
+    status = getattr(obj, "status_code", None)
+    response = getattr(obj, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    headers = getattr(obj, "headers", None)
+    if headers is None and response is not None:
+        headers = getattr(response, "headers", None)
+    return status, headers or {}
+
+
+def _is_retryable_exception(exc):
+    if isinstance(exc, RETRY_EXCEPTIONS):
+        return True
+    # openai.APIConnectionError / APITimeoutError
+    if type(exc).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return True
+    status, _ = _status_and_headers(exc)
+    return status in RETRY_STATUSES
+
+
+class Scheduler:
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def configure(self, name, rate, **options) -> Endpoint:
+        # Idempotent: the first registration of an endpoint wins
+        with self._lock:
+            if name not in self._endpoints:
+                self._endpoints[name] = Endpoint(name, rate, **options)
+            return self._endpoints[name]
+
+    def endpoint(self, name) -> Endpoint:
+        try:
+            return self._endpoints[name]
+        except KeyError:
+            raise ValueError(f"Unknown endpoint: {name}") from None
+
+    def call(self, name, fn, *args, **kwargs):
+        # Run fn under the endpoint's limits. A response with a retryable
+        # status is retried; after the last attempt it is returned as-is so
+        # the caller can handle it. Retryable exceptions are re-raised once
+        # attempts run out; anything else propagates immediately.
+        endpoint = self.endpoint(name)
+        attempt = 0
+        while True:
+            endpoint.wait_until_unblocked()
+            endpoint.bucket.acquire()
+            with endpoint.slots:
+                try:
+                    result = fn(*args, **kwargs)
+                    error = None
+                except Exception as e:
+                    if not _is_retryable_exception(e):
+                        raise
+                    result, error = None, e
+
+            status, headers = _status_and_headers(error if error is not None else result)
+            if error is None and status not in RETRY_STATUSES:
+                endpoint.recover()
+                return result
+            if error is None and endpoint.permanent is not None and endpoint.permanent(result):
+                # The server answered; it isn't overloaded, so no throttling
+                return result
+
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            if status == 429 or retry_after is not None:
+                endpoint.throttle(retry_after)
+            if attempt >= endpoint.max_retries:
+                if error is not None:
+                    raise error
+                return result
+
+            delay = endpoint.backoff(attempt, retry_after)
+            print(f"[~] {name}: {error or f'HTTP {status}'}; retry {attempt + 1}/{endpoint.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+# Process-wide scheduler shared by every client
+scheduler = Scheduler()
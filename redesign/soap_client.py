@@ -1,29 +1,72 @@
 import requests, xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
 from config import (SOAP_URL_SANMAR, SOAP_ID_SANMAR, SOAP_PASSWORD_SANMAR, HEADERS, SANMAR_SOAP_NAMESPACES, SOAP_ID_EDWARDS,
-                    SOAP_PASSWORD_EDWARDS, SOAP_URL_EDWARDS, EDWARDS_SOAP_NAMESPACES)
+                    SOAP_PASSWORD_EDWARDS, SOAP_URL_EDWARDS, EDWARDS_SOAP_NAMESPACES, SOAP_RATE_SANMAR,
+                    SOAP_CONCURRENCY_SANMAR, SOAP_RATE_EDWARDS, SOAP_CONCURRENCY_EDWARDS, REQUEST_MAX_RETRIES,
+                    SOAP_TIMEOUT)
+from scheduler import scheduler, is_soap_fault, soap_fault
+from metrics import STAGE_ERRORS, timed
 from abc import ABC, abstractmethod
 
+
+class SOAPFetchError(Exception):
+    pass
+
+
 class BaseSOAPClient(ABC):
+    # Subclasses set the supplier name, the scheduler endpoint and its limits
+    name = None
+    endpoint = None
+    rate = None
+    concurrency = None
+
+    def __init__(self):
+        scheduler.configure(self.endpoint, self.rate, concurrency=self.concurrency,
+                            max_retries=REQUEST_MAX_RETRIES, permanent=is_soap_fault)
+        # One pooled session per client, sized to the endpoint's concurrency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, url, payload, stage="soap_fetch"):
+        # Timed per supplier, including time spent waiting on the rate limiter
+        with timed(stage, self.name):
+            resp = scheduler.call(self.endpoint, self.session.post, url, headers=HEADERS, data=payload,
+                                  timeout=SOAP_TIMEOUT)
+        if resp.status_code >= 400:
+            STAGE_ERRORS.inc(stage=stage, supplier=self.name)
+        return resp
 
     @abstractmethod
     def get_sellable_product_ids(self):
         pass
 
     @abstractmethod
-    def fetch_product_data(self, product_ids):
+    def fetch_product_xml(self, product_id):
+        # Raw GetProduct response bytes; raises on transport or HTTP errors
         pass
 
+    def fetch_product_data(self, product_id):
+        try:
+            return parse_product(self.name, product_id, self.fetch_product_xml(product_id))
+        except Exception as e:
+            print(f"[!] Exception for {product_id}: {e}")
+            return None
+
 
 def get_client(impl_name="A") -> BaseSOAPClient:
-    if impl_name == "sanmar":
-        return SOAPClientSanMarImpl()
-    elif impl_name == "edwards":
-        return SOAPClientEdwardsImpl()
-    else:
+    if impl_name not in SUPPLIERS:
         raise ValueError(f"Unknown implementation: {impl_name}")
+    return SUPPLIERS[impl_name]()
 
 
 class SOAPClientSanMarImpl(BaseSOAPClient):
+    name = "sanmar"
+    endpoint = "soap:sanmar"
+    rate = SOAP_RATE_SANMAR
+    concurrency = SOAP_CONCURRENCY_SANMAR
+
     def get_sellable_product_ids(self):
         # Implementation A
         payload = f"""
@@ -42,7 +85,7 @@ class SOAPClientSanMarImpl(BaseSOAPClient):
         </soapenv:Envelope>
         """
 
-        resp = requests.post(SOAP_URL_SANMAR + "?WSDL", headers=HEADERS, data=payload)
+        resp = self.post(SOAP_URL_SANMAR + "?WSDL", payload, stage="soap_sellable")
         root = ET.fromstring(resp.text)
 
         product_ids = set()
@@ -53,7 +96,7 @@ class SOAPClientSanMarImpl(BaseSOAPClient):
 
         return list(product_ids)
 
-    def fetch_product_data(self, product_id):
+    def product_request(self, product_id):
         payload = f"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" 
             xmlns:ns="http://www.promostandards.org/WSDL/ProductDataService/2.0.0/" 
             xmlns:shar="http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/">
@@ -69,113 +112,24 @@ class SOAPClientSanMarImpl(BaseSOAPClient):
                 </ns:GetProductRequest>
             </soapenv:Body>
         </soapenv:Envelope>"""
+        return payload
 
-        headers = {'Content-Type': 'text/xml'}
+    def fetch_product_xml(self, product_id):
+        resp = self.post(SOAP_URL_SANMAR, self.product_request(product_id))
+        if resp.status_code != 200:
+            fault = soap_fault(resp)
+            if fault is not None:
+                raise SOAPFetchError(f"SOAP Fault for {product_id}: {fault or resp.status_code}")
+            raise SOAPFetchError(f"HTTP error for {product_id}: {resp.status_code}")
+        return resp.content
 
-        try:
-            resp = requests.post(SOAP_URL_SANMAR, headers=headers, data=payload)
-            if resp.status_code != 200:
-                print(f"[!] HTTP error for {product_id}: {resp.status_code}")
-                return None
-
-            xml_root = ET.fromstring(resp.text)
-
-            # Namespaces for XML elements
-            namespaces = {
-                'ns2': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/',
-                'def': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/'
-            }
-
-            product = xml_root.find('.//ns2:Product', namespaces)
-            if product is None:
-                print(f"[!] No product found in response for {product_id}")
-                return None
-
-            def get_text(elem, tag):
-                e = elem.find(tag, namespaces)
-                return e.text.strip() if e is not None and e.text else None
-
-            product_id_val = get_text(product, 'def:productId')
-            product_name = get_text(product, 'def:productName')
-            product_brand = get_text(product, 'def:productBrand')
-            image_url = get_text(product, 'def:primaryImageUrl')
-
-            # Descriptions combined
-            descriptions = [d.text.strip() for d in product.findall('def:description', namespaces) if d.text]
-            combined_description = " ".join(descriptions)
-
-            # Keywords
-            keywords = []
-            keyword_array = product.find('ns2:ProductKeywordArray', namespaces)
-            if keyword_array is not None:
-                for kw in keyword_array.findall('def:ProductKeyword/def:keyword', namespaces):
-                    if kw.text:
-                        keywords.append(kw.text.strip())
-
-            # Categories and subcategories extraction
-            categories = []
-            product_categories = product.findall('ns2:ProductCategoryArray/def:ProductCategory', namespaces)
-            for cat in product_categories:
-                cat_name_el = cat.find('def:category', namespaces)
-                sub_cat_el = cat.find('def:subCategory', namespaces)
-                if cat_name_el is not None and cat_name_el.text:
-                    categories.append(cat_name_el.text.strip())
-                if sub_cat_el is not None and sub_cat_el.text:
-                    # split comma separated subcategories and add individually
-                    categories.extend([s.strip() for s in sub_cat_el.text.split(',')])
-
-            # Product parts info
-            colors = set()
-            sizes = set()
-            gtin = None
-            flags = {}
-
-            product_parts = product.findall('ns2:ProductPartArray/ns2:ProductPart', namespaces)
-            for part in product_parts:
-                primary_color = part.find('ns2:primaryColor/def:Color/def:standardColorName', namespaces)
-                if primary_color is not None and primary_color.text:
-                    colors.add(primary_color.text.strip())
-
-                color_array = part.findall('ns2:ColorArray/def:Color/def:standardColorName', namespaces)
-                for c in color_array:
-                    if c.text:
-                        colors.add(c.text.strip())
-
-                apparel_size = part.find('def:ApparelSize', namespaces)
-                if apparel_size is not None:
-                    label_size = apparel_size.find('def:labelSize', namespaces)
-                    if label_size is not None and label_size.text:
-                        sizes.add(label_size.text.strip())
-
-                gtin_el = part.find('def:gtin', namespaces)
-                if gtin_el is not None and gtin_el.text:
-                    gtin = gtin_el.text.strip()
-
-                for flag_name in ['isRushService', 'isCloseout', 'isCaution', 'isOnDemand', 'isHazmat']:
-                    flag_el = part.find(f'def:{flag_name}', namespaces)
-                    if flag_el is not None and flag_el.text:
-                        flags[flag_name] = flag_el.text.strip().lower() == 'true'
-
-            product_data = {
-                "product_id": product_id_val,
-                "name": product_name,
-                "brand": product_brand,
-                "image_url": image_url,
-                "description": combined_description,
-                "keywords": keywords,
-                "categories": categories,
-                "colors": list(colors),
-                "sizes": list(sizes),
-                "gtin": gtin,
-                "flags": flags
-            }
-            return product_data
-
-        except Exception as e:
-            print(f"[!] Exception for {product_id}: {e}")
-            return None
 
 class SOAPClientEdwardsImpl(BaseSOAPClient):
+    name = "edwards"
+    endpoint = "soap:edwards"
+    rate = SOAP_RATE_EDWARDS
+    concurrency = SOAP_CONCURRENCY_EDWARDS
+
     def get_sellable_product_ids(self):
         # Implementation A
         payload = f"""
@@ -194,7 +148,7 @@ class SOAPClientEdwardsImpl(BaseSOAPClient):
         </soapenv:Envelope>
         """
 
-        resp = requests.post(SOAP_URL_EDWARDS + "?WSDL", headers=HEADERS, data=payload)
+        resp = self.post(SOAP_URL_EDWARDS + "?WSDL", payload, stage="soap_sellable")
         root = ET.fromstring(resp.text)
 
         product_ids = set()
@@ -205,7 +159,7 @@ class SOAPClientEdwardsImpl(BaseSOAPClient):
 
         return list(product_ids)
 
-    def fetch_product_data(self, product_id):
+    def product_request(self, product_id):
         payload = f"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" 
             xmlns:ns="http://www.promostandards.org/WSDL/ProductDataService/1.0.0/" 
             xmlns:shar="http://www.promostandards.org/WSDL/ProductDataService/1.0.0/SharedObjects/">
@@ -221,109 +175,221 @@ class SOAPClientEdwardsImpl(BaseSOAPClient):
                 </ns:GetProductRequest>
             </soapenv:Body>
         </soapenv:Envelope>"""
-
-        headers = {'Content-Type': 'text/xml'}
-
-        try:
-            resp = requests.post(SOAP_URL_EDWARDS, headers=headers, data=payload)
-            if resp.status_code != 200:
-                print(f"[!] HTTP error for {product_id}: {resp.status_code}")
-                return None
-
-            xml_root = ET.fromstring(resp.text)
-
-            # Namespaces for XML elements
-            namespaces = {
-                'ns2': 'http://www.promostandards.org/WSDL/ProductDataService/1.0.0/',
-                'def': 'http://www.promostandards.org/WSDL/ProductDataService/1.0.0/SharedObjects/',
-                'ns3': 'http://www.promostandards.org/WSDL/ProductDataService/1.0.0/SharedObjects/',
-
-            }
-
-            product = xml_root.find('.//ns2:Product', namespaces)
-            if product is None:
-                print(f"[!] No product found in response for {product_id}")
-                return None
-
-            def get_text(elem, tag):
-                e = elem.find(tag, namespaces)
-                return e.text.strip() if e is not None and e.text else None
-
-            product_id_val = get_text(product, 'def:productId')
-            product_name = get_text(product, 'ns2:productName')
-            product_brand = get_text(product, 'ns2:productBrand')
-            # image_url = get_text(product, 'def:primaryImageUrl')
-            # Descriptions combined
-            descriptions = [d.text.strip() for d in product.findall('ns3:description', namespaces) if d.text]
-            combined_description = " ".join(descriptions)
-
-            # Keywords
-            keywords = []
-            keyword_array = product.find('ns2:ProductKeywordArray', namespaces)
-            if keyword_array is not None:
-                for kw in keyword_array.findall('ns2:ProductKeyword/ns2:keyword', namespaces):
-                    if kw.text:
-                        keywords.append(kw.text.strip())
-
-            # Categories and subcategories extraction
-            categories = []
-            product_categories = product.findall('ns2:ProductCategoryArray/ns2:ProductCategory', namespaces)
-            for cat in product_categories:
-                cat_name_el = cat.find('ns2:category', namespaces)
-                sub_cat_el = cat.find('def:subCategory', namespaces)
-                if cat_name_el is not None and cat_name_el.text:
-                    categories.append(cat_name_el.text.strip())
-                if sub_cat_el is not None and sub_cat_el.text:
-                    # split comma separated subcategories and add individually
-                    categories.extend([s.strip() for s in sub_cat_el.text.split(',')])
-
-            # Product parts info
-            colors = set()
-            sizes = set()
-            gtin = None
-            flags = {}
-
-            product_parts = product.findall('ns2:ProductPartArray/ns2:ProductPart', namespaces)
-            for part in product_parts:
-                primary_color = part.find('ns2:primaryColor/def:Color/def:standardColorName', namespaces)
-                if primary_color is not None and primary_color.text:
-                    colors.add(primary_color.text.strip())
-
-                color_array = part.findall('ns2:ColorArray/ns2:Color/ns2:colorName', namespaces)
-                for c in color_array:
-                    if c.text:
-                        colors.add(c.text.strip())
-
-                apparel_size = part.find('def:ApparelSize', namespaces)
-                if apparel_size is not None:
-                    label_size = apparel_size.find('def:labelSize', namespaces)
-                    if label_size is not None and label_size.text:
-                        sizes.add(label_size.text.strip())
-
-                gtin_el = part.find('def:gtin', namespaces)
-                if gtin_el is not None and gtin_el.text:
-                    gtin = gtin_el.text.strip()
-
-                for flag_name in ['isRushService', 'isCloseout', 'isCaution', 'isOnDemand', 'isHazmat']:
-                    flag_el = part.find(f'def:{flag_name}', namespaces)
-                    if flag_el is not None and flag_el.text:
-                        flags[flag_name] = flag_el.text.strip().lower() == 'true'
-
-            product_data = {
-                "product_id": product_id_val,
-                "name": product_name,
-                "brand": product_brand,
-                # "image_url": image_url,
-                "description": combined_description,
-                "keywords": keywords,
-                "categories": categories,
-                "colors": list(colors),
-                "sizes": list(sizes),
-                "gtin": gtin,
-                "flags": flags
-            }
-            return product_data
-
-        except Exception as e:
-            print(f"[!] Exception for {product_id}: {e}")
-            return None
+        return payload
+
+    def fetch_product_xml(self, product_id):
+        resp = self.post(SOAP_URL_EDWARDS, self.product_request(product_id))
+        if resp.status_code != 200:
+            fault = soap_fault(resp)
+            if fault is not None:
+                raise SOAPFetchError(f"SOAP Fault for {product_id}: {fault or resp.status_code}")
+            raise SOAPFetchError(f"HTTP error for {product_id}: {resp.status_code}")
+        return resp.content
+
+
+def parse_product_sanmar(product_id, raw):
+    xml_root = ET.fromstring(raw)
+
+    # Namespaces for XML elements
+    namespaces = {
+        'ns2': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/',
+        'def': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/'
+    }
+
+    product = xml_root.find('.//ns2:Product', namespaces)
+    if product is None:
+        print(f"[!] No product found in response for {product_id}")
+        return None
+
+    def get_text(elem, tag):
+        e = elem.find(tag, namespaces)
+        return e.text.strip() if e is not None and e.text else None
+
+    product_id_val = get_text(product, 'def:productId')
+    product_name = get_text(product, 'def:productName')
+    product_brand = get_text(product, 'def:productBrand')
+    image_url = get_text(product, 'def:primaryImageUrl')
+
+    # Descriptions combined
+    descriptions = [d.text.strip() for d in product.findall('def:description', namespaces) if d.text]
+    combined_description = " ".join(descriptions)
+
+    # Keywords
+    keywords = []
+    keyword_array = product.find('ns2:ProductKeywordArray', namespaces)
+    if keyword_array is not None:
+        for kw in keyword_array.findall('def:ProductKeyword/def:keyword', namespaces):
+            if kw.text:
+                keywords.append(kw.text.strip())
+
+    # Categories and subcategories extraction
+    categories = []
+    product_categories = product.findall('ns2:ProductCategoryArray/def:ProductCategory', namespaces)
+    for cat in product_categories:
+        cat_name_el = cat.find('def:category', namespaces)
+        sub_cat_el = cat.find('def:subCategory', namespaces)
+        if cat_name_el is not None and cat_name_el.text:
+            categories.append(cat_name_el.text.strip())
+        if sub_cat_el is not None and sub_cat_el.text:
+            # split comma separated subcategories and add individually
+            categories.extend([s.strip() for s in sub_cat_el.text.split(',')])
+
+    # Product parts info
+    colors = set()
+    sizes = set()
+    gtin = None
+    flags = {}
+
+    product_parts = product.findall('ns2:ProductPartArray/ns2:ProductPart', namespaces)
+    for part in product_parts:
+        primary_color = part.find('ns2:primaryColor/def:Color/def:standardColorName', namespaces)
+        if primary_color is not None and primary_color.text:
+            colors.add(primary_color.text.strip())
+
+        color_array = part.findall('ns2:ColorArray/def:Color/def:standardColorName', namespaces)
+        for c in color_array:
+            if c.text:
+                colors.add(c.text.strip())
+
+        apparel_size = part.find('def:ApparelSize', namespaces)
+        if apparel_size is not None:
+            label_size = apparel_size.find('def:labelSize', namespaces)
+            if label_size is not None and label_size.text:
+                sizes.add(label_size.text.strip())
+
+        gtin_el = part.find('def:gtin', namespaces)
+        if gtin_el is not None and gtin_el.text:
+            gtin = gtin_el.text.strip()
+
+        for flag_name in ['isRushService', 'isCloseout', 'isCaution', 'isOnDemand', 'isHazmat']:
+            flag_el = part.find(f'def:{flag_name}', namespaces)
+            if flag_el is not None and flag_el.text:
+                flags[flag_name] = flag_el.text.strip().lower() == 'true'
+
+    product_data = {
+        "product_id": product_id_val,
+        "name": product_name,
+        "brand": product_brand,
+        "image_url": image_url,
+        "description": combined_description,
+        "keywords": keywords,
+        "categories": categories,
+        "colors": list(colors),
+        "sizes": list(sizes),
+        "gtin": gtin,
+        "flags": flags
+    }
+    return product_data
+
+
+def parse_product_edwards(product_id, raw):
+    xml_root = ET.fromstring(raw)
+
+    # Namespaces for XML elements
+    namespaces = {
+        'ns2': 'http://www.promostandards.org/WSDL/ProductDataService/1.0.0/',
+        'def': 'http://www.promostandards.org/WSDL/ProductDataService/1.0.0/SharedObjects/',
+        'ns3': 'http://www.promostandards.org/WSDL/ProductDataService/1.0.0/SharedObjects/',
+
+    }
+
+    product = xml_root.find('.//ns2:Product', namespaces)
+    if product is None:
+        print(f"[!] No product found in response for {product_id}")
+        return None
+
+    def get_text(elem, tag):
+        e = elem.find(tag, namespaces)
+        return e.text.strip() if e is not None and e.text else None
+
+    product_id_val = get_text(product, 'def:productId')
+    product_name = get_text(product, 'ns2:productName')
+    product_brand = get_text(product, 'ns2:productBrand')
+    # image_url = get_text(product, 'def:primaryImageUrl')
+    # Descriptions combined
+    descriptions = [d.text.strip() for d in product.findall('ns3:description', namespaces) if d.text]
+    combined_description = " ".join(descriptions)
+
+    # Keywords
+    keywords = []
+    keyword_array = product.find('ns2:ProductKeywordArray', namespaces)
+    if keyword_array is not None:
+        for kw in keyword_array.findall('ns2:ProductKeyword/ns2:keyword', namespaces):
+            if kw.text:
+                keywords.append(kw.text.strip())
+
+    # Categories and subcategories extraction
+    categories = []
+    product_categories = product.findall('ns2:ProductCategoryArray/ns2:ProductCategory', namespaces)
+    for cat in product_categories:
+        cat_name_el = cat.find('ns2:category', namespaces)
+        sub_cat_el = cat.find('def:subCategory', namespaces)
+        if cat_name_el is not None and cat_name_el.text:
+            categories.append(cat_name_el.text.strip())
+        if sub_cat_el is not None and sub_cat_el.text:
+            # split comma separated subcategories and add individually
+            categories.extend([s.strip() for s in sub_cat_el.text.split(',')])
+
+    # Product parts info
+    colors = set()
+    sizes = set()
+    gtin = None
+    flags = {}
+
+    product_parts = product.findall('ns2:ProductPartArray/ns2:ProductPart', namespaces)
+    for part in product_parts:
+        primary_color = part.find('ns2:primaryColor/def:Color/def:standardColorName', namespaces)
+        if primary_color is not None and primary_color.text:
+            colors.add(primary_color.text.strip())
+
+        color_array = part.findall('ns2:ColorArray/ns2:Color/ns2:colorName', namespaces)
+        for c in color_array:
+            if c.text:
+                colors.add(c.text.strip())
+
+        apparel_size = part.find('def:ApparelSize', namespaces)
+        if apparel_size is not None:
+            label_size = apparel_size.find('def:labelSize', namespaces)
+            if label_size is not None and label_size.text:
+                sizes.add(label_size.text.strip())
+
+        gtin_el = part.find('def:gtin', namespaces)
+        if gtin_el is not None and gtin_el.text:
+            gtin = gtin_el.text.strip()
+
+        for flag_name in ['isRushService', 'isCloseout', 'isCaution', 'isOnDemand', 'isHazmat']:
+            flag_el = part.find(f'def:{flag_name}', namespaces)
+            if flag_el is not None and flag_el.text:
+                flags[flag_name] = flag_el.text.strip().lower() == 'true'
+
+    product_data = {
+        "product_id": product_id_val,
+        "name": product_name,
+        "brand": product_brand,
+        # "image_url": image_url,
+        "description": combined_description,
+        "keywords": keywords,
+        "categories": categories,
+        "colors": list(colors),
+        "sizes": list(sizes),
+        "gtin": gtin,
+        "flags": flags
+    }
+    return product_data
+
+
+# Suppliers available to get_client, by name
+SUPPLIERS = {
+    "sanmar": SOAPClientSanMarImpl,
+    "edwards": SOAPClientEdwardsImpl,
+}
+
+# Parsers are module-level functions so they can run in a process pool
+PARSERS = {
+    "sanmar": parse_product_sanmar,
+    "edwards": parse_product_edwards,
+}
+
+
+def parse_product(supplier, product_id, raw):
+    return PARSERS[supplier](product_id, raw)
@@ -1,11 +1,19 @@
-from supabase import create_client
 from config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_TABLE
+from metrics import timed
+from lazy import per_process
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+@per_process
+def get_supabase():
+    # Created on first use so importing this module stays cheap
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def product_exists(product_id: str):
-    res = supabase.table(SUPABASE_TABLE).select("product_id").eq("product_id", product_id).execute()
+    with timed("supabase_read"):
+        res = get_supabase().table(SUPABASE_TABLE).select("product_id").eq("product_id", product_id).execute()
     return bool(res.data)
 
 def upsert_to_supabase(product_data: dict):
-    supabase.table(SUPABASE_TABLE).upsert(product_data).execute()
+    # updated_at is set by the database (supabase/migrations), not here
+    with timed("supabase_write"):
+        get_supabase().table(SUPABASE_TABLE).upsert(product_data).execute()
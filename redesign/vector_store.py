@@ -1,23 +1,55 @@
-from openai import OpenAI
-from qdrant_client import QdrantClient, models
-from config import QDRANT_URL, QDRANT_API_KEY, COLLECTION_NAME, VECTOR_DIM
-from qdrant_client.models import PointStruct, VectorParams, Distance
+from config import (QDRANT_URL, QDRANT_API_KEY, COLLECTION_NAME, VECTOR_DIM, OPENAI_RATE, OPENAI_CONCURRENCY,
+                    REQUEST_MAX_RETRIES, QDRANT_PAYLOAD_FIELDS, QDRANT_ON_DISK_PAYLOAD)
+from scheduler import scheduler
+from metrics import timed
+from lazy import per_process
+from qdrant_client.models import PointStruct
+from qdrant_collections import ensure_collection
+from qdrant_payload import parse_payload_fields, project_payload
 import os
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+PAYLOAD_FIELDS = parse_payload_fields(QDRANT_PAYLOAD_FIELDS)
+
+# Clients are created on first use so importing this module (and spawning
+# worker processes that import it) stays cheap
+
+def configure_openai(share=1.0):
+    # OPENAI_RATE is one account-wide limit; a process running alongside
+    # others gets `share` of it. The first call in a process wins.
+    scheduler.configure("openai", OPENAI_RATE * share, concurrency=OPENAI_CONCURRENCY,
+                        max_retries=REQUEST_MAX_RETRIES)
+
+@per_process
+def get_openai_client():
+    from openai import OpenAI
+    configure_openai()
+    # Retries are handled by the shared scheduler, not the SDK
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+@per_process
+def get_qdrant():
+    from qdrant_client import QdrantClient
+    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+def init_collection():
+    ensure_collection(get_qdrant(), COLLECTION_NAME, VECTOR_DIM, on_disk_payload=QDRANT_ON_DISK_PAYLOAD or None)
 
 def generate_embedding(text: str):
-    res = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
+    with timed("embedding"):
+        res = scheduler.call(
+            "openai",
+            get_openai_client().embeddings.create,
+            model="text-embedding-3-small",
+            input=text
+        )
     return res.data[0].embedding
 
-def upsert_to_qdrant(point_id, vector, payload):
-    qdrant.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[
-            PointStruct(id=point_id, vector=vector, payload=payload)
-        ]
-    )
+def upsert_to_qdrant(point_id, vector, product):
+    payload = project_payload(product, PAYLOAD_FIELDS)
+    with timed("qdrant_upsert"):
+        get_qdrant().upsert(
+            collection_name=COLLECTION_NAME,
+            points=[
+                PointStruct(id=point_id, vector=vector, payload=payload)
+            ]
+        )
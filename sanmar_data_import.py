@@ -3,12 +3,17 @@ import xml.etree.ElementTree as ET
 from supabase import create_client, Client
 from openai import OpenAI
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
-from supabase import create_client
+from qdrant_client.models import PointStruct
 import uuid
-import time
 import os
 
+from redesign.config import (OPENAI_RATE, OPENAI_CONCURRENCY, REQUEST_MAX_RETRIES, SOAP_RATE_SANMAR,
+                             SOAP_CONCURRENCY_SANMAR, QDRANT_PAYLOAD_FIELDS, QDRANT_ON_DISK_PAYLOAD)
+from redesign.lazy import per_process
+from redesign.scheduler import scheduler, is_soap_fault
+from redesign.qdrant_collections import ensure_collection
+from redesign.qdrant_payload import parse_payload_fields, project_payload
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -27,67 +32,77 @@ SOAP_PASSWORD = os.getenv("SOAP_PASSWORD")
 # Setup Supabase
 supabase_table = "search_engine"
 
-# SOAP credentials
+VECTOR_DIM = 1536
+COLLECTION_NAME = "products"
+PAYLOAD_FIELDS = parse_payload_fields(QDRANT_PAYLOAD_FIELDS)
 
-supabase: Client = create_client(supabase_url, supabase_key)
 
+# Connect lazily, once per process, so importing this module has no side effects
+@per_process
+def get_supabase() -> Client:
+    return create_client(supabase_url, supabase_key)
 
 
-# Connect
-openai_client = OpenAI(api_key=openai_api_key)
-qdrant = QdrantClient(
-    url=qdrant_url,
-    api_key=qdrant_api_key,
-)
-supabase = create_client(supabase_url, supabase_key)
+@per_process
+def get_openai_client():
+    scheduler.configure("openai", OPENAI_RATE, concurrency=OPENAI_CONCURRENCY, max_retries=REQUEST_MAX_RETRIES)
+    # Retries and pacing are handled by the shared scheduler, not the SDK
+    return OpenAI(api_key=openai_api_key, max_retries=0)
 
-# Create collection
-VECTOR_DIM = 1536
-COLLECTION_NAME = "products"
 
-# Check if collection exists
-if not qdrant.collection_exists(COLLECTION_NAME):
-    qdrant.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=VECTOR_DIM, distance=Distance.COSINE)
+@per_process
+def get_qdrant():
+    return QdrantClient(
+        url=qdrant_url,
+        api_key=qdrant_api_key,
     )
-else:
-    print(f"Collection '{COLLECTION_NAME}' already exists. Skipping creation.")
+
+
+scheduler.configure("soap:sanmar", SOAP_RATE_SANMAR, concurrency=SOAP_CONCURRENCY_SANMAR,
+                    max_retries=REQUEST_MAX_RETRIES, permanent=is_soap_fault)
+
+
+def init_collection():
+    # Check if collection exists (COLLECTION_NAME may be an alias after a rebuild)
+    ensure_collection(get_qdrant(), COLLECTION_NAME, VECTOR_DIM, on_disk_payload=QDRANT_ON_DISK_PAYLOAD or None)
+
 
 # Initial request to get sellable product IDs
-url = SOAP_URL + "?WSDL"
-payload = f"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" 
-    xmlns:ns="http://www.promostandards.org/WSDL/ProductDataService/2.0.0/" 
-    xmlns:shar="http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/">
-    <soapenv:Header/>
-    <soapenv:Body>
-        <ns:GetProductSellableRequest>
-            <shar:wsVersion>2.0.0</shar:wsVersion>
-            <shar:id>{SOAP_ID}</shar:id>
-            <shar:password>{SOAP_PASSWORD}</shar:password>
-            <shar:isSellable>true</shar:isSellable>
-        </ns:GetProductSellableRequest>
-    </soapenv:Body>
-</soapenv:Envelope>"""
-headers = {'Content-Type': 'text/xml'}
-
-response = requests.post(url, headers=headers, data=payload)
-root = ET.fromstring(response.text)
-
-namespaces = {
-    'S': 'http://schemas.xmlsoap.org/soap/envelope/',
-    'ns2': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/',
-    '': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/'
-}
-
-product_sellables = root.findall('.//ns2:ProductSellable', namespaces)
-unique_ids = set()
-for item in product_sellables:
-    product_id_el = item.find('.//{http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/}productId')
-    if product_id_el is not None:
-        unique_ids.add(product_id_el.text)
-product_id_list = list(unique_ids)
-print(f"Found {len(product_id_list)} unique product IDs")
+def get_sellable_product_ids():
+    url = SOAP_URL + "?WSDL"
+    payload = f"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" 
+        xmlns:ns="http://www.promostandards.org/WSDL/ProductDataService/2.0.0/" 
+        xmlns:shar="http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/">
+        <soapenv:Header/>
+        <soapenv:Body>
+            <ns:GetProductSellableRequest>
+                <shar:wsVersion>2.0.0</shar:wsVersion>
+                <shar:id>{SOAP_ID}</shar:id>
+                <shar:password>{SOAP_PASSWORD}</shar:password>
+                <shar:isSellable>true</shar:isSellable>
+            </ns:GetProductSellableRequest>
+        </soapenv:Body>
+    </soapenv:Envelope>"""
+    headers = {'Content-Type': 'text/xml'}
+
+    response = scheduler.call("soap:sanmar", requests.post, url, headers=headers, data=payload)
+    root = ET.fromstring(response.text)
+
+    namespaces = {
+        'S': 'http://schemas.xmlsoap.org/soap/envelope/',
+        'ns2': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/',
+        '': 'http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/'
+    }
+
+    product_sellables = root.findall('.//ns2:ProductSellable', namespaces)
+    unique_ids = set()
+    for item in product_sellables:
+        product_id_el = item.find('.//{http://www.promostandards.org/WSDL/ProductDataService/2.0.0/SharedObjects/}productId')
+        if product_id_el is not None:
+            unique_ids.add(product_id_el.text)
+    product_id_list = list(unique_ids)
+    print(f"Found {len(product_id_list)} unique product IDs")
+    return product_id_list
 
 # Function to fetch and parse detailed product data for each productId
 def fetch_product_data(product_id: str) -> dict | None:
@@ -110,7 +125,7 @@ def fetch_product_data(product_id: str) -> dict | None:
     headers = {'Content-Type': 'text/xml'}
 
     try:
-        resp = requests.post(SOAP_URL, headers=headers, data=payload)
+        resp = scheduler.call("soap:sanmar", requests.post, SOAP_URL, headers=headers, data=payload)
         if resp.status_code != 200:
             print(f"[!] HTTP error for {product_id}: {resp.status_code}")
             return None
@@ -223,55 +238,63 @@ def get_point_id(product_id_str):
 
 # Generate vector
 def get_embedding(text):
-    response = openai_client.embeddings.create(
+    response = scheduler.call(
+        "openai",
+        get_openai_client().embeddings.create,
         model="text-embedding-3-small",
         input=text
     )
     return response.data[0].embedding
 
-for pid in product_id_list:
-    data = fetch_product_data(pid)
-    if data:
-        # Check if product already exists in Supabase
-        existing = (
-            supabase
-            .table(supabase_table)
-            .select("product_id")
-            .eq("product_id", data["product_id"])
-            .execute()
-        )
-        if existing.data:
-            print(f"[i] Skipped {pid} — already exists in Supabase")
-            continue
-        print(f"Inserting data for {pid}")
-        supabase.table(supabase_table).upsert(data).execute()
-        # Upload to Qdrant
-        points = []
-        text_parts = [
-            data["name"],
-            data["brand"],
-            data["description"],
-            ", ".join(data["keywords"]),
-            ", ".join(data["categories"])
-        ]
-        combined_text = " ".join(text_parts)
-        # Generate embedding with OpenAI
-        vector = get_embedding(combined_text)
-
-        point = PointStruct(
-            id=get_point_id(data["product_id"]),
-            vector=vector,
-            payload=data
-        )
-
-        # Upsert this single point to Qdrant
-        qdrant.upsert(
-            collection_name=COLLECTION_NAME,
-            points=[point]
-        )
-        print(f"Uploaded {len(points)} products to Qdrant.")
-        # exit(1)
-        time.sleep(0.5)
-    else:
-        print(f"[!] Skipped {pid} — no data found or error")
-
+def main():
+    init_collection()
+    product_id_list = get_sellable_product_ids()
+
+    for pid in product_id_list:
+        data = fetch_product_data(pid)
+        if data:
+            # Check if product already exists in Supabase
+            existing = (
+                get_supabase()
+                .table(supabase_table)
+                .select("product_id")
+                .eq("product_id", data["product_id"])
+                .execute()
+            )
+            if existing.data:
+                print(f"[i] Skipped {pid} — already exists in Supabase")
+                continue
+            print(f"Inserting data for {pid}")
+            get_supabase().table(supabase_table).upsert(data).execute()
+            # Upload to Qdrant
+            points = []
+            text_parts = [
+                data["name"],
+                data["brand"],
+                data["description"],
+                ", ".join(data["keywords"]),
+                ", ".join(data["categories"])
+            ]
+            combined_text = " ".join(text_parts)
+            # Generate embedding with OpenAI
+            vector = get_embedding(combined_text)
+
+            point = PointStruct(
+                id=get_point_id(data["product_id"]),
+                vector=vector,
+                payload=project_payload(data, PAYLOAD_FIELDS)
+            )
+
+            # Upsert this single point to Qdrant
+            get_qdrant().upsert(
+                collection_name=COLLECTION_NAME,
+                points=[point]
+            )
+            print(f"Uploaded {len(points)} products to Qdrant.")
+            # exit(1)
+        else:
+            print(f"[!] Skipped {pid} — no data found or error")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
 import os
+import gzip
+import hashlib
+import json
 import requests
+import time
+import zlib
 import xml.etree.ElementTree as ET
-from openai import OpenAI
-from qdrant_client import QdrantClient
-from supabase import create_client
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, g, request, jsonify, render_template_string
 from dotenv import load_dotenv
+from product_catalog import ProductCatalog
+from qdrant_client.models import QueryRequest
+from redesign.lazy import per_process
+from redesign import metrics
+from redesign.metrics import timed
+from redesign.qdrant_collections import resolve_alias, content_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 load_dotenv()
 
@@ -22,20 +35,193 @@ SOAP_ID = os.getenv("SOAP_ID")
 SOAP_PASSWORD = os.getenv("SOAP_PASSWORD")
 COLLECTION_NAME = "products"
 VECTOR_DIM = 1536
+# OpenAI accepts at most 2048 inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 2048
+# Queries accepted by one /search/batch request
+MAX_BATCH_QUERIES = 100
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "1000"))
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "60"))
+# How long to trust what Qdrant last said about the search collection (alias
+# target, point count, content version); ETags lag behind a rebuild or
+# reindex by at most this much
+ALIAS_REFRESH_SECONDS = float(os.getenv("ALIAS_REFRESH_SECONDS", "10"))
+# Smaller bodies aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+# Products hydrated and flushed per chunk in NDJSON mode
+STREAM_CHUNK_SIZE = 10
+
+# Clients are created on first use and shared by every request in the
+# process. The OpenAI and Supabase SDK imports are deferred to the accessors.
+@per_process
+def get_openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+@per_process
+def get_qdrant():
+    from qdrant_client import QdrantClient
+    return QdrantClient(url=QDRANT_URL, api_key=qdrant_api_key)
+
+@per_process
+def get_supabase():
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@per_process
+def get_catalog():
+    catalog = ProductCatalog(get_supabase(), SUPABASE_TABLE, page_size=CATALOG_PAGE_SIZE,
+                             refresh_seconds=CATALOG_REFRESH_SECONDS)
+    catalog.start()
+    return catalog
+
+def _reset_clients():
+    # A forked worker must not reuse the parent's sockets or refresh thread.
+    # Clients are rebuilt lazily; an already loaded catalog is kept and only
+    # reconnected, so the parent's warm-up isn't thrown away.
+    for accessor in (get_openai_client, get_qdrant, get_supabase):
+        accessor.reset()
+    catalog = get_catalog.peek()
+    get_catalog.reset(keep=True)
+    if catalog is not None:
+        catalog.after_fork(get_supabase())
+
+def warm_up():
+    # Catalog first: it's the expensive part and doesn't depend on Qdrant
+    get_catalog()
+    get_openai_client()
+    get_qdrant().get_collection(COLLECTION_NAME)
+    index_state()
+
+_started = False
+
+def start():
+    # Importing this module only defines things; call start() once before the
+    # process takes traffic so no request pays for paging in the whole table.
+    # It preloads the catalog and clients and resets them in forked children.
+    # Under gunicorn, call it from a server hook in gunicorn.conf.py:
+    #
+    #   def when_ready(server):         # with --preload: once, in the master;
+    #       import search_engine_frontend  # workers inherit the loaded catalog
+    #       search_engine_frontend.start()
+    #
+    #   def post_worker_init(worker):   # without --preload: in each worker
+    #       import search_engine_frontend
+    #       search_engine_frontend.start()
+    global _started
+    if _started:
+        return
+    _started = True
+    os.register_at_fork(after_in_child=_reset_clients)
+    try:
+        warm_up()
+    except Exception as e:
+        # Still serve; whatever failed is retried lazily on first use
+        print(f"[!] Warm-up failed, continuing with lazy loading: {e}")
 
-# Clients
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-qdrant = QdrantClient(url=QDRANT_URL, api_key=qdrant_api_key)
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 app = Flask(__name__)
 
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    if "started" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - g.started, route=route, status=response.status_code)
+    return response
+
 def get_embedding(text: str) -> list:
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
+    with timed("embedding"):
+        response = get_openai_client().embeddings.create(
+            model="text-embedding-3-small",
+            input=text
+        )
     return response.data[0].embedding
 
+def get_embeddings(texts: list) -> list:
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        with timed("embedding"):
+            response = get_openai_client().embeddings.create(
+                model="text-embedding-3-small",
+                input=texts[start:start + EMBEDDING_BATCH_SIZE]
+            )
+        # Results come back with an index; don't rely on their order
+        vectors.extend(d.embedding for d in sorted(response.data, key=lambda d: d.index))
+    return vectors
+
+def hit_product_ids(hits) -> list:
+    return [hit.payload.get("product_id", hit.id) for hit in hits]
+
+def response_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+def compress_response(response):
+    response.vary.add("Accept-Encoding")
+    encoding = response_encoding()
+    if encoding is None or response.status_code != 200 or response.is_streamed:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(brotli.compress(data, quality=5) if encoding == "br" else gzip.compress(data, 6))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+def encode_stream(chunks, encoding):
+    # Flush after every chunk so each one reaches the client right away
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    else:
+        yield from chunks
+
+# Last known state of the collection behind COLLECTION_NAME and when it was
+# checked
+_index_state = {"state": None, "checked_at": 0.0}
+
+def index_state():
+    # [collection the alias resolves to, point count, content version],
+    # checked at most every ALIAS_REFRESH_SECONDS so ETag checks don't cost
+    # Qdrant calls each
+    now = time.monotonic()
+    if _index_state["state"] is None or now - _index_state["checked_at"] >= ALIAS_REFRESH_SECONDS:
+        try:
+            qdrant = get_qdrant()
+            collection = resolve_alias(qdrant, COLLECTION_NAME) or COLLECTION_NAME
+            info = qdrant.get_collection(collection)
+            state = [collection, info.points_count, content_version(info)]
+        except Exception as e:
+            print(f"[!] Qdrant state lookup failed, using {_index_state['state']}: {e}")
+            state = _index_state["state"] or [COLLECTION_NAME, None, None]
+        _index_state.update(state=state, checked_at=now)
+    return _index_state["state"]
+
+def search_etag(query, excluded_brands, fmt):
+    # Results change when the rows do (the catalog version tracks count and
+    # latest updated_at), when a rebuild points the alias at a new collection,
+    # or when a reindex rewrites vectors in place (content version)
+    key = json.dumps([get_catalog().version, index_state(), query, sorted(excluded_brands), fmt])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def wants_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
+
 def get_inventory(product_id, color, size):
     payload = f"""<soapenv:Envelope xmlns:soapenv=\"http://schemas.xmlsoap.org/soap/envelope/\" xmlns:ns=\"http://www.promostandards.org/WSDL/Inventory/2.0.0/\" xmlns:shar=\"http://www.promostandards.org/WSDL/Inventory/2.0.0/SharedObjects/\">
         <soapenv:Header />
@@ -58,7 +244,10 @@ def get_inventory(product_id, color, size):
     </soapenv:Envelope>"""
 
     headers = {'Content-Type': 'text/xml'}
-    response = requests.post(SOAP_INVENTORY_URL_SANMAR, headers=headers, data=payload)
+    with timed("inventory_soap", "sanmar"):
+        response = requests.post(SOAP_INVENTORY_URL_SANMAR, headers=headers, data=payload)
+    if response.status_code >= 400:
+        metrics.STAGE_ERRORS.inc(stage="inventory_soap", supplier="sanmar")
     return parse_inventory_response(response.text)
 
 def parse_inventory_response(xml_str):
@@ -81,21 +270,107 @@ def search():
     if not query:
         return jsonify({"error": "Missing query parameter 'q'"}), 400
 
+    ndjson = wants_ndjson()
+    etag = search_etag(query, excluded_brands, "ndjson" if ndjson else "json")
+    # Checked before any embedding or Qdrant work. Weak, because the same
+    # results may be sent with different content encodings.
+    not_modified = request.if_none_match.contains_weak(etag)
+    metrics.cache_result("search_etag", not_modified)
+    if not_modified:
+        response = Response(status=304)
+    elif ndjson:
+        response = search_stream(query, excluded_brands)
+    else:
+        response = compress_response(jsonify(search_results(query, excluded_brands)))
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+def search_hits(query):
     query_vector = get_embedding(query)
-    result = qdrant.query_points(
-        collection_name=COLLECTION_NAME,
-        query=query_vector,
-        with_vectors=True,
-        with_payload=True,
-    )
-    hits = result.points
-    product_ids = [hit.payload.get("product_id", hit.id) for hit in hits]
-    response = supabase.table(SUPABASE_TABLE).select("*").in_("product_id", product_ids).execute()
-    id_to_product = {p["product_id"]: p for p in response.data}
-    ordered_results = [id_to_product[pid] for pid in product_ids if pid in id_to_product]
+    with timed("qdrant_query"):
+        result = get_qdrant().query_points(
+            collection_name=COLLECTION_NAME,
+            query=query_vector,
+            # Only the ID is needed; rows come from the catalog
+            with_payload=["product_id"],
+        )
+    return hit_product_ids(result.points)
+
+def search_results(query, excluded_brands):
+    ordered_results = get_catalog().hydrate(search_hits(query))
     if excluded_brands:
         ordered_results = [p for p in ordered_results if p.get("brand") not in excluded_brands]
-    return jsonify(ordered_results)
+    return ordered_results
+
+def search_stream(query, excluded_brands):
+    # One JSON object per line, written as soon as each chunk is hydrated
+    product_ids = search_hits(query)
+    encoding = response_encoding()
+
+    def lines():
+        for product in get_catalog().iter_hydrate(product_ids, STREAM_CHUNK_SIZE):
+            if product.get("brand") not in excluded_brands:
+                yield json.dumps(product).encode() + b"\n"
+
+    response = Response(encode_stream(lines(), encoding), mimetype="application/x-ndjson")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+@app.route("/search/batch", methods=["POST"])
+def search_batch():
+    data = request.get_json(silent=True)
+    queries = data.get("queries") if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Missing or empty 'queries' list"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+    # Each query is either a plain string or {"q": ..., "excluded_brands": [...], "limit": n}
+    parsed = []
+    for item in queries:
+        if isinstance(item, str):
+            item = {"q": item}
+        if not isinstance(item, dict) or not isinstance(item.get("q"), str) or not item["q"].strip():
+            return jsonify({"error": "Every query needs a non-empty string 'q'"}), 400
+        excluded_brands = item.get("excluded_brands", [])
+        if not isinstance(excluded_brands, list) or not all(isinstance(b, str) for b in excluded_brands):
+            return jsonify({"error": "'excluded_brands' must be a list of strings"}), 400
+        limit = item.get("limit")
+        # bool is an int subclass; reject it along with zero and negatives
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+            return jsonify({"error": "'limit' must be a positive integer"}), 400
+        parsed.append({
+            "q": item["q"].strip(),
+            "excluded_brands": excluded_brands,
+            "limit": limit,
+        })
+
+    vectors = get_embeddings([item["q"] for item in parsed])
+    query_requests = []
+    for item, vector in zip(parsed, vectors):
+        options = {"limit": item["limit"]} if item["limit"] is not None else {}
+        # Only the ID is needed; rows come from the catalog
+        query_requests.append(QueryRequest(query=vector, with_payload=["product_id"], **options))
+    # One round-trip to Qdrant for the whole batch
+    with timed("qdrant_query"):
+        responses = get_qdrant().query_batch_points(collection_name=COLLECTION_NAME, requests=query_requests)
+
+    # Hydrate the union of all hits once, then rebuild each query's order
+    per_query_ids = [hit_product_ids(r.points) for r in responses]
+    unique_ids = list(dict.fromkeys(pid for ids in per_query_ids for pid in ids))
+    id_to_product = {p["product_id"]: p for p in get_catalog().hydrate(unique_ids)}
+
+    results = []
+    for item, product_ids in zip(parsed, per_query_ids):
+        excluded = item["excluded_brands"]
+        ordered = [id_to_product[pid] for pid in product_ids if pid in id_to_product]
+        if excluded:
+            ordered = [p for p in ordered if p.get("brand") not in excluded]
+        results.append({"q": item["q"], "results": ordered})
+    return compress_response(jsonify(results))
 
 @app.route("/inventory", methods=["POST"])
 def inventory():
@@ -109,6 +384,10 @@ def inventory():
     print(locations)
     return jsonify(locations)
 
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/")
 def index():
     return render_template_string("""
@@ -202,4 +481,5 @@ async function checkInventory(pid) {
 """)
 
 if __name__ == "__main__":
+    start()
     app.run(debug=True)
@@ -0,0 +1,24 @@
+-- updated_at is the change signal for the frontend catalog (product_catalog.py)
+-- and the catch-up after a blue-green rebuild (embedding.py --rebuild). The
+-- database sets it, so every writer shares one clock no matter which host
+-- the write came from.
+
+alter table search_engine
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function search_engine_set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists search_engine_set_updated_at on search_engine;
+create trigger search_engine_set_updated_at
+    before insert or update on search_engine
+    for each row execute function search_engine_set_updated_at();
+
+create index if not exists search_engine_updated_at_idx on search_engine (updated_at);